@@ -1,23 +1,125 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
 import json
+import copy
+import hmac
+import os
+import sys
 from datetime import datetime, date, timedelta
-from google.oauth2.service_account import Credentials
-import gspread
-import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from storage import (
+    COLLECTIONS, StorageBackend, SQLiteBackend, MirroredBackend, LocalSnapshot, MutationJournal,
+    WriteBehindWriter
+)
+from perf import RECORDER, span, timed
+from models import ExerciseRecord, Session, WeightEntry
+from units import parse_kg
+from history import (
+    HistoryRepository, EXERCISE_ROW_COLUMNS, build_history_frame, build_exercise_frame,
+    build_weight_calories_frame
+)
+from core import (
+    GIORNI, TEMPLATE_HEADER, HISTORY_HEADER, CONFIG_HEADER, WEIGHT_CALORIES_HEADER,
+    LEGACY_HISTORY_SHEET, LEGACY_HISTORY_HEADER, SHEET_HEADERS, RAW_RECORD_SHEETS,
+    parse_template_records, parse_config_records, parse_weight_calories_records,
+    parse_history_records, parse_legacy_history_records, values_to_records,
+    cell_to_text, column_letter, history_to_rows, history_records_to_rows, diff_history_rows,
+    history_row_updates, weight_calories_to_rows, needs_kg_migration,
+    compute_data_hash, calculate_current_week
+)
+# gspread, google-auth e plotly vengono importati solo dove servono
+
+# Inizio del rerun, per la misura dei tempi
+rerun_start = time.perf_counter()
 
 # Configurazione pagina
 st.set_page_config(page_title="Workout Tracker", page_icon="💪", layout="wide")
 
-# Giorni della settimana
-GIORNI = ["Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato", "Domenica"]
+# Sincronizzazione dello storico: "delta" (solo righe cambiate) o "full" (riscrive tutto)
+HISTORY_SYNC_MODE = st.secrets.get("history_sync_mode", "delta")
+
+# Numero massimo di worksheet letti/scritti in parallelo (1 = sequenziale)
+SYNC_MAX_WORKERS = int(st.secrets.get("sync_max_workers", 4))
+
+# Salvataggi dalla UI in background (scrittura differita)
+WRITE_BEHIND = st.secrets.get("write_behind", True)
+
+# Giornale locale delle modifiche non ancora sincronizzate ("" per disattivarlo)
+JOURNAL_PATH = st.secrets.get("journal_path", "workout_journal.jsonl")
+
+# Snapshot locale dell'ultimo caricamento, mostrato subito all'avvio ("" per disattivarlo)
+SNAPSHOT_PATH = st.secrets.get("snapshot_path", "workout_snapshot.json")
+
+# Quota delle API di Google Sheets: richieste al minuto e raffica massima
+SHEETS_REQUESTS_PER_MINUTE = int(st.secrets.get("sheets_requests_per_minute", 60))
+SHEETS_BURST = int(st.secrets.get("sheets_burst", 10))
+
+# Connessioni HTTP tenute aperte verso Google Sheets (condivise da tutte le sessioni)
+SHEETS_POOL_SIZE = int(st.secrets.get("sheets_pool_size", 10))
+
+# Chiavi dei secrets che indicano lo spreadsheet da aprire
+SPREADSHEET_KEYS = ("spreadsheet_url", "spreadsheet_id", "spreadsheet_name")
+
+# Numero massimo di grafici tenuti in cache (condivisi tra le sessioni)
+FIGURE_CACHE_SIZE = int(st.secrets.get("figure_cache_size", 64))
+
+# Sessioni mostrate per pagina nello storico
+STORICO_PAGE_SIZE = int(st.secrets.get("storico_page_size", 10))
+
+# --- ATLETI ---
+def get_athletes():
+    """Atleti configurati nei secrets ([athletes.<id>]); vuoto in modalità singolo utente"""
+    return {athlete: dict(config) for athlete, config in st.secrets.get("athletes", {}).items()}
+
+def get_athlete_config(athlete):
+    """Impostazioni di un atleta ("" = utente unico, configurato nei secrets principali)"""
+    return get_athletes().get(athlete, {}) if athlete else {}
+
+def sheet_title(name, athlete=''):
+    """Nome del worksheet di un atleta.
+    
+    Gli atleti che condividono lo spreadsheet principale hanno i tab con il
+    prefisso "<id>_" (o tab_prefix dei secrets).
+    """
+    if not athlete:
+        return name
+    config = get_athlete_config(athlete)
+    own_spreadsheet = any(config.get(key) for key in SPREADSHEET_KEYS)
+    return config.get('tab_prefix', '' if own_spreadsheet else f"{athlete}_") + name
+
+def athlete_path(path, athlete=''):
+    """File locale (database, giornale, snapshot) separato per atleta"""
+    if not athlete or not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{athlete}{ext}"
+
+def current_athlete():
+    """Atleta della sessione corrente ("" in modalità singolo utente)"""
+    return st.session_state.get('athlete', '')
 
 # --- CONNESSIONE GOOGLE SHEETS ---
+@st.cache_resource
+def get_sheets_gateway():
+    """Limitatore e contatori condivisi da tutte le richieste a Google Sheets"""
+    from sheets_gateway import SheetsGateway
+    return SheetsGateway(
+        requests_per_minute=SHEETS_REQUESTS_PER_MINUTE,
+        burst=SHEETS_BURST,
+        max_retries=int(st.secrets.get("sheets_max_retries", 5))
+    )
+
 @st.cache_resource
 def get_gsheet_client():
-    """Connessione a Google Sheets"""
+    """Connessione a Google Sheets, unica per il processo (sessioni e atleti)"""
+    import gspread
+    from google.auth.transport.requests import AuthorizedSession
+    from google.oauth2.service_account import Credentials
+    from requests.adapters import HTTPAdapter
     try:
         credentials = Credentials.from_service_account_info(
             st.secrets["gcp_service_account"],
@@ -26,52 +128,102 @@ def get_gsheet_client():
                 "https://www.googleapis.com/auth/drive"
             ]
         )
-        return gspread.authorize(credentials)
+        # Una sola sessione HTTP con un pool di connessioni riusate da tutti i thread
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=SHEETS_POOL_SIZE, pool_maxsize=SHEETS_POOL_SIZE)
+        session.mount("https://", adapter)
+        # Ogni richiesta HTTP di gspread passa dal gateway (quota e retry)
+        return gspread.authorize(
+            credentials,
+            http_client=get_sheets_gateway().http_client_class(),
+            session=session
+        )
     except Exception as e:
         st.error(f"Errore connessione Google Sheets: {e}")
         return None
 
-def get_worksheet(sheet_name):
+@st.cache_resource
+def get_spreadsheet(athlete):
+    """Apre lo spreadsheet dell'atleta (una sola volta, condiviso tra le chiamate)"""
+    client = get_gsheet_client()
+    if not client:
+        return None
+    
+    # Senza uno spreadsheet proprio l'atleta usa quello principale
+    settings = get_athlete_config(athlete)
+    if not any(settings.get(key) for key in SPREADSHEET_KEYS):
+        settings = st.secrets
+    
+    spreadsheet_id = settings.get("spreadsheet_id", "")
+    spreadsheet_url = settings.get("spreadsheet_url", "")
+    
+    if spreadsheet_url:
+        return client.open_by_url(spreadsheet_url)
+    elif spreadsheet_id:
+        return client.open_by_key(spreadsheet_id)
+    else:
+        return client.open(settings["spreadsheet_name"])
+
+@st.cache_resource
+def get_worksheet_registry(athlete):
+    """Registro degli handle dei worksheet e degli header già verificati di un atleta"""
+    return {'worksheets': {}, 'headers': set()}
+
+def invalidate_sheets_cache(athlete=''):
+    """Invalida spreadsheet, worksheet e header di un atleta memorizzati in cache"""
+    get_spreadsheet.clear(athlete)
+    get_worksheet_registry.clear(athlete)
+
+def get_worksheet(sheet_name, athlete=''):
     """Ottiene un worksheet specifico"""
+    title = sheet_title(sheet_name, athlete)
     try:
-        client = get_gsheet_client()
-        if not client:
-            return None
-        
-        spreadsheet_id = st.secrets.get("spreadsheet_id", "")
-        spreadsheet_url = st.secrets.get("spreadsheet_url", "")
+        registry = get_worksheet_registry(athlete)
+        worksheet = registry['worksheets'].get(sheet_name)
+        if worksheet:
+            return worksheet
         
-        if spreadsheet_url:
-            spreadsheet = client.open_by_url(spreadsheet_url)
-        elif spreadsheet_id:
-            spreadsheet = client.open_by_key(spreadsheet_id)
-        else:
-            spreadsheet = client.open(st.secrets["spreadsheet_name"])
+        spreadsheet = get_spreadsheet(athlete)
+        if not spreadsheet:
+            return None
         
+        from gspread.exceptions import WorksheetNotFound
         try:
-            worksheet = spreadsheet.worksheet(sheet_name)
-        except gspread.exceptions.WorksheetNotFound:
-            worksheet = spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=20)
+            worksheet = spreadsheet.worksheet(title)
+        except WorksheetNotFound:
+            worksheet = spreadsheet.add_worksheet(title=title, rows=1000, cols=20)
         
+        registry['worksheets'][sheet_name] = worksheet
         return worksheet
     except Exception as e:
-        st.error(f"Errore accesso worksheet '{sheet_name}': {e}")
+        st.error(f"Errore accesso worksheet '{title}': {e}")
         return None
 
-def save_template_to_sheets():
+def ensure_header(worksheet, header, athlete=''):
+    """Verifica l'header del worksheet (una sola volta finché la cache è valida)"""
+    registry = get_worksheet_registry(athlete)
+    if worksheet.title in registry['headers']:
+        return
+    
+    try:
+        headers = worksheet.row_values(1)
+        if headers[:len(header)] != header:
+            worksheet.update('A1', [header])
+    except:
+        worksheet.update('A1', [header])
+    
+    registry['headers'].add(worksheet.title)
+
+@timed()
+def save_template_to_sheets(template, athlete=''):
     """Salva il template su Google Sheets"""
     try:
-        worksheet = get_worksheet("Template")
+        worksheet = get_worksheet("Template", athlete)
         if not worksheet:
             return False
         
         # Assicurati che esista l'header
-        try:
-            headers = worksheet.row_values(1)
-            if not headers or headers[0] != 'Giorno':
-                worksheet.update('A1', [['Giorno', 'Esercizio_JSON']])
-        except:
-            worksheet.update('A1', [['Giorno', 'Esercizio_JSON']])
+        ensure_header(worksheet, TEMPLATE_HEADER, athlete)
         
         # Elimina tutte le righe esistenti (tranne header)
         all_records = worksheet.get_all_records()
@@ -80,7 +232,7 @@ def save_template_to_sheets():
         
         # Aggiungi i nuovi dati
         data = []
-        for day, exercises in st.session_state.workout_template.items():
+        for day, exercises in template.items():
             if exercises:
                 data.append([day, json.dumps(exercises, ensure_ascii=False)])
         
@@ -92,40 +244,16 @@ def save_template_to_sheets():
         st.error(f"Errore salvataggio template: {e}")
         return False
         
-def load_template_from_sheets():
-    """Carica il template da Google Sheets"""
-    try:
-        worksheet = get_worksheet("Template")
-        if not worksheet:
-            return False
-        
-        records = worksheet.get_all_records()
-        st.session_state.workout_template = {day: [] for day in GIORNI}
-        
-        for record in records:
-            day = record.get('Giorno')
-            exercises_json = record.get('Esercizio_JSON')
-            if day and exercises_json:
-                st.session_state.workout_template[day] = json.loads(exercises_json)
-        
-        return True
-    except Exception as e:
-        st.error(f"Errore caricamento template: {e}")
-        return False
 
-def save_config_to_sheets():
+@timed()
+def save_config_to_sheets(data_inizio_scheda, athlete=''):
     """Salva la configurazione (data inizio scheda)"""
     try:
-        worksheet = get_worksheet("Config")
+        worksheet = get_worksheet("Config", athlete)
         if not worksheet:
             return False
         
-        try:
-            headers = worksheet.row_values(1)
-            if not headers or headers[0] != 'Chiave':
-                worksheet.update('A1', [['Chiave', 'Valore']])
-        except:
-            worksheet.update('A1', [['Chiave', 'Valore']])
+        ensure_header(worksheet, CONFIG_HEADER, athlete)
         
         all_records = worksheet.get_all_records()
         row_to_update = None
@@ -136,219 +264,622 @@ def save_config_to_sheets():
         
         if row_to_update:
             worksheet.update(f'A{row_to_update}:B{row_to_update}', 
-                           [['data_inizio_scheda', st.session_state.data_inizio_scheda]])
+                           [['data_inizio_scheda', data_inizio_scheda]])
         else:
-            worksheet.append_row(['data_inizio_scheda', st.session_state.data_inizio_scheda])
+            worksheet.append_row(['data_inizio_scheda', data_inizio_scheda])
         
         return True
     except Exception as e:
         st.error(f"Errore salvataggio configurazione: {e}")
         return False
         
-def load_config_from_sheets():
-    """Carica la configurazione"""
-    try:
-        worksheet = get_worksheet("Config")
-        if not worksheet:
-            return False
-        
-        records = worksheet.get_all_records()
-        for record in records:
-            if record.get('Chiave') == 'data_inizio_scheda':
-                st.session_state.data_inizio_scheda = record.get('Valore', '')
-        
-        return True
-    except Exception as e:
-        st.error(f"Errore caricamento configurazione: {e}")
-        return False
 
-def save_weight_calories_to_sheets():
+@timed()
+def save_weight_calories_to_sheets(entries, athlete=''):
     """Salva lo storico peso e calorie su Google Sheets"""
     try:
-        worksheet = get_worksheet("WeightCalories")
+        worksheet = get_worksheet("WeightCalories", athlete)
         if not worksheet:
             return False
         
-        try:
-            headers = worksheet.row_values(1)
-            if not headers or headers[0] != 'Data':
-                worksheet.update('A1', [['Data', 'Peso', 'Calorie']])
-        except:
-            worksheet.update('A1', [['Data', 'Peso', 'Calorie']])
+        ensure_header(worksheet, WEIGHT_CALORIES_HEADER, athlete)
         
         all_records = worksheet.get_all_records()
-        if all_records:
-            worksheet.delete_rows(2, len(all_records) + 1)
-        
-        data = []
-        for entry in st.session_state.weight_calories_history:
-            data.append([
-                entry['data'],
-                entry['peso'],
-                entry['calorie']
-            ])
+        data = weight_calories_to_rows(entries)
         
+        # Come per lo storico: prima le nuove righe, poi via quelle in eccesso
         if data:
-            worksheet.append_rows(data)
+            last_col = column_letter(len(WEIGHT_CALORIES_HEADER) - 1)
+            worksheet.batch_update([{'range': f"A2:{last_col}{len(data) + 1}", 'values': data}])
+        if len(all_records) > len(data):
+            worksheet.delete_rows(len(data) + 2, len(all_records) + 1)
         
         return True
     except Exception as e:
         st.error(f"Errore salvataggio peso/calorie: {e}")
         return False
 
-def load_weight_calories_from_sheets():
-    """Carica lo storico peso e calorie da Google Sheets"""
-    try:
-        worksheet = get_worksheet("WeightCalories")
-        if not worksheet:
-            return False
-        
-        records = worksheet.get_all_records()
-        st.session_state.weight_calories_history = []
-        
-        for record in records:
-            # Converti peso e calorie in stringa, gestendo sia numeri che stringhe
-            peso_val = record.get('Peso', '')
-            calorie_val = record.get('Calorie', '')
-            
-            # Gestisci il peso: se è un numero, formattalo con una cifra decimale
-            if peso_val not in ['', None]:
-                try:
-                    peso_str = f"{float(peso_val):.1f}"
-                except:
-                    peso_str = str(peso_val)
-            else:
-                peso_str = ''
-            
-            # Gestisci le calorie: converti in intero
-            if calorie_val not in ['', None]:
-                try:
-                    calorie_str = str(int(float(calorie_val)))
-                except:
-                    calorie_str = str(calorie_val)
-            else:
-                calorie_str = ''
-            
-            entry = {
-                'data': record.get('Data'),
-                'peso': peso_str,
-                'calorie': calorie_str
-            }
-            st.session_state.weight_calories_history.append(entry)
-        
-        return True
-    except Exception as e:
-        st.error(f"Errore caricamento peso/calorie: {e}")
-        return False
         
-def save_history_to_sheets():
-    """Salva lo storico su Google Sheets"""
+
+@timed()
+def save_history_to_sheets(history, synced_rows=None, athlete=''):
+    """Salva lo storico su Google Sheets.
+    
+    Con synced_rows (le righe già presenti sul foglio) invia solo le differenze.
+    Ritorna le righe ora presenti sul foglio, None in caso di errore.
+    """
     try:
-        worksheet = get_worksheet("History")
+        worksheet = get_worksheet("HistoryRows", athlete)
         if not worksheet:
-            return False
-        
-        try:
-            headers = worksheet.row_values(1)
-            if not headers or headers[0] != 'Data':
-                worksheet.update('A1', [['Data', 'Giorno', 'Settimana', 'Esercizi_JSON']])
-        except:
-            worksheet.update('A1', [['Data', 'Giorno', 'Settimana', 'Esercizi_JSON']])
-        
-        all_records = worksheet.get_all_records()
-        if all_records:
-            worksheet.delete_rows(2, len(all_records) + 1)
+            return None
         
-        data = []
-        for session in st.session_state.workout_history:
-            data.append([
-                session['data'],
-                session['giorno'],
-                session.get('settimana', 1),
-                json.dumps(session['esercizi'], ensure_ascii=False)
-            ])
+        ensure_header(worksheet, HISTORY_HEADER, athlete)
         
-        if data:
-            worksheet.append_rows(data)
+        desired_rows = history_to_rows(history)
+        if HISTORY_SYNC_MODE == "delta" and synced_rows is not None:
+            # Invia solo le righe cambiate, inserite o eliminate
+            rows, changed = diff_history_rows(synced_rows, desired_rows)
+            if changed:
+                worksheet.batch_update(history_row_updates(rows, changed))
+        else:
+            all_records = worksheet.get_all_records()
+            rows = desired_rows
+            
+            # Prima si sovrascrivono le righe, poi si eliminano quelle in
+            # eccesso: un errore a metà non lascia mai il foglio vuoto
+            if rows:
+                worksheet.batch_update(history_row_updates(rows, range(len(rows))))
+            if len(all_records) > len(rows):
+                worksheet.delete_rows(len(rows) + 2, len(all_records) + 1)
         
-        return True
+        return rows
     except Exception as e:
         st.error(f"Errore salvataggio storico: {e}")
-        return False
+        return None
         
-def load_history_from_sheets():
-    """Carica lo storico da Google Sheets"""
+
+@timed()
+def migrate_legacy_history(athlete=''):
+    """Migrazione una tantum dal vecchio worksheet History a HistoryRows.
+    
+    Il vecchio worksheet non viene modificato. Ritorna le righe scritte.
+    """
+    from gspread.exceptions import APIError
+    spreadsheet = get_spreadsheet(athlete)
     try:
-        worksheet = get_worksheet("History")
-        if not worksheet:
+        response = spreadsheet.values_get(
+            f"'{sheet_title(LEGACY_HISTORY_SHEET, athlete)}'",
+            params={'valueRenderOption': 'UNFORMATTED_VALUE', 'dateTimeRenderOption': 'FORMATTED_STRING'}
+        )
+    except APIError:
+        # Nessun worksheet History: niente da migrare
+        response = {}
+    
+    values = response.get('values', [])
+    legacy = []
+    if values and values[0][:len(LEGACY_HISTORY_HEADER)] == LEGACY_HISTORY_HEADER:
+        legacy = parse_legacy_history_records(values_to_records(values))
+    
+    worksheet = get_worksheet("HistoryRows", athlete)
+    ensure_header(worksheet, HISTORY_HEADER, athlete)
+    rows = history_to_rows(legacy)
+    if rows:
+        worksheet.append_rows(rows)
+    return rows
+
+@timed()
+def fetch_all_values(athlete=''):
+    """Legge tutti i worksheet con una sola richiesta batch"""
+    spreadsheet = get_spreadsheet(athlete)
+    if not spreadsheet:
+        return None
+    
+    response = spreadsheet.values_batch_get(
+        [f"'{sheet_title(name, athlete)}'" for name in SHEET_HEADERS],
+        # Numeri non formattati, date come testo (come le mostra il foglio)
+        params={'valueRenderOption': 'UNFORMATTED_VALUE', 'dateTimeRenderOption': 'FORMATTED_STRING'}
+    )
+    value_ranges = response.get('valueRanges', [])
+    return {
+        name: value_range.get('values', [])
+        for name, value_range in zip(SHEET_HEADERS, value_ranges)
+    }
+
+@timed()
+def fetch_all_values_per_tab(athlete=''):
+    """Legge i worksheet uno per uno (li crea se mancanti)"""
+    all_values = {}
+    
+    def fetch_operation(sheet_name):
+        def operation():
+            worksheet = get_worksheet(sheet_name, athlete)
+            if not worksheet:
+                return False
+            all_values[sheet_name] = worksheet.get_values(
+                value_render_option='UNFORMATTED_VALUE', date_time_render_option='FORMATTED_STRING'
+            )
+            return True
+        return operation
+    
+    if not run_tab_operations([fetch_operation(name) for name in SHEET_HEADERS]):
+        return None
+    return all_values
+
+@timed()
+def fetch_history_columns(columns, first_row=2, athlete=''):
+    """Legge solo alcune colonne di HistoryRows, a partire da first_row.
+    
+    Ritorna una lista di dict colonna -> valore, una per riga.
+    """
+    spreadsheet = get_spreadsheet(athlete)
+    title = sheet_title('HistoryRows', athlete)
+    ranges = []
+    for column in columns:
+        letter = column_letter(HISTORY_HEADER.index(column))
+        ranges.append(f"'{title}'!{letter}{first_row}:{letter}")
+    
+    response = spreadsheet.values_batch_get(
+        ranges,
+        params={
+            'valueRenderOption': 'UNFORMATTED_VALUE',
+            'dateTimeRenderOption': 'FORMATTED_STRING',
+            'majorDimension': 'COLUMNS'
+        }
+    )
+    column_values = [
+        (value_range.get('values') or [[]])[0]
+        for value_range in response.get('valueRanges', [])
+    ]
+    
+    n_rows = max((len(values) for values in column_values), default=0)
+    return [
+        {column: values[i] if i < len(values) else '' for column, values in zip(columns, column_values)}
+        for i in range(n_rows)
+    ]
+
+def run_tab_operations(operations):
+    """Esegue le operazioni indipendenti sui worksheet, in parallelo se possibile.
+    
+    Ritorna True solo se tutte le operazioni sono andate a buon fine.
+    """
+    def run(operation):
+        try:
+            return operation()
+        except Exception as e:
+            st.error(f"Errore sincronizzazione: {e}")
             return False
+    
+    if SYNC_MAX_WORKERS <= 1 or len(operations) <= 1:
+        return all([run(operation) for operation in operations])
+    
+    # I thread del pool devono vedere la sessione corrente (session_state, st.error)
+    ctx = get_script_run_ctx()
+    
+    def run_with_ctx(operation):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return run(operation)
+    
+    workers = min(SYNC_MAX_WORKERS, len(operations))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return all(list(pool.map(run_with_ctx, operations)))
+
+class SheetsBackend(StorageBackend):
+    """Backend su Google Sheets (un worksheet per collezione) di un atleta"""
+    
+    name = 'sheets'
+    
+    def __init__(self, athlete=''):
+        self.athlete = athlete
+        # Righe di History presenti sul foglio, per la sincronizzazione delta
+        self.history_synced_rows = None
+        self._history_lock = threading.Lock()
+    
+    def load_all(self):
+        # Lock tenuto dalla lettura all'aggiornamento delle righe sincronizzate:
+        # un salvataggio dello storico nel frattempo le renderebbe già vecchie
+        with self._history_lock:
+            try:
+                all_values = fetch_all_values(self.athlete)
+            except Exception:
+                # Es. worksheet mancanti: la lettura per singolo tab li crea
+                all_values = fetch_all_values_per_tab(self.athlete)
+            
+            if all_values is None:
+                return None
+            
+            # Header già presenti: evita il controllo al primo salvataggio
+            registry = get_worksheet_registry(self.athlete)
+            for name, header in SHEET_HEADERS.items():
+                values = all_values[name]
+                if values and values[0][:len(header)] == header:
+                    registry['headers'].add(sheet_title(name, self.athlete))
+            
+            # Storico e peso: i testi (es. "4,4,4" o "74,5") restano testi
+            all_records = {
+                name: values_to_records(values, numericise=name not in RAW_RECORD_SHEETS)
+                for name, values in all_values.items()
+            }
+            if not all_values['HistoryRows']:
+                # HistoryRows mai inizializzato: importa il vecchio formato
+                all_records['HistoryRows'] = values_to_records(
+                    [HISTORY_HEADER] + migrate_legacy_history(self.athlete), numericise=False
+                )
+            
+            data = {
+                'workout_template': parse_template_records(all_records['Template']),
+                'workout_history': parse_history_records(all_records['HistoryRows']),
+                'weight_calories_history': parse_weight_calories_records(all_records['WeightCalories']),
+            }
+            data_inizio_scheda = parse_config_records(all_records['Config'])
+            if data_inizio_scheda is not None:
+                data['data_inizio_scheda'] = data_inizio_scheda
+            
+            self.history_synced_rows = history_records_to_rows(all_records['HistoryRows'])
         
-        records = worksheet.get_all_records()
-        st.session_state.workout_history = []
+        # Migrazione una tantum ai chili canonici: i fogli senza Peso_Kg
+        # vengono riscritti subito con la nuova colonna
+        if needs_kg_migration(all_values['HistoryRows']):
+            self.save('workout_history', data['workout_history'])
+        if needs_kg_migration(all_values['WeightCalories']):
+            self.save('weight_calories_history', data['weight_calories_history'])
+        return data
+    
+    def load_history_rows(self, columns, exercise=None):
+        fetch_columns = list(columns)
+        if exercise is not None and 'Esercizio' not in fetch_columns:
+            fetch_columns.append('Esercizio')
         
-        for record in records:
-            session = {
-                'data': record.get('Data'),
-                'giorno': record.get('Giorno'),
-                'settimana': record.get('Settimana', 1),
-                'esercizi': json.loads(record.get('Esercizi_JSON', '[]'))
-            }
-            st.session_state.workout_history.append(session)
+        rows = fetch_history_columns(fetch_columns, athlete=self.athlete)
+        if exercise is not None:
+            rows = [r for r in rows if cell_to_text(r['Esercizio']).lower() == exercise.lower()]
+        return [{column: row[column] for column in columns} for row in rows]
+    
+    def save(self, key, value):
+        if key == 'workout_history':
+            with self._history_lock:
+                # In caso di errore lo stato del foglio non è noto: si riscrive tutto
+                self.history_synced_rows = save_history_to_sheets(
+                    value, self.history_synced_rows, self.athlete
+                )
+                return self.history_synced_rows is not None
+        
+        savers = {
+            'workout_template': save_template_to_sheets,
+            'data_inizio_scheda': save_config_to_sheets,
+            'weight_calories_history': save_weight_calories_to_sheets,
+        }
+        return savers[key](value, self.athlete)
+
+# --- BACKEND DI PERSISTENZA ---
+@st.cache_resource
+def get_storage_backend(athlete):
+    """Backend dell'atleta configurato nei secrets: "sheets" (default) o "sqlite" """
+    backend_name = st.secrets.get("storage_backend", "sheets")
+    
+    if backend_name == "sqlite":
+        backend = SQLiteBackend(athlete_path(st.secrets.get("sqlite_path", "workout_tracker.db"), athlete))
+        if st.secrets.get("storage_mirror_sheets", False):
+            backend = MirroredBackend(backend, SheetsBackend(athlete))
+        return backend
+    
+    return SheetsBackend(athlete)
+
+# --- TRACCIAMENTO MODIFICHE ---
+def mark_synced(key):
+    """Registra lo stato attuale della collezione come sincronizzato"""
+    st.session_state.synced_hashes[key] = compute_data_hash(st.session_state[key])
+
+def make_save_operation(key, force=False):
+    """Prepara il salvataggio di una collezione (None se non è cambiata)"""
+    value = st.session_state[key]
+    value_hash = compute_data_hash(value)
+    if not force and st.session_state.synced_hashes.get(key) == value_hash:
+        return None
     
+    backend = get_storage_backend(current_athlete())
+    
+    def operation():
+        with span('backend.save'):
+            saved = backend.save(key, value)
+        if not saved:
+            return False
+        st.session_state.synced_hashes[key] = value_hash
         return True
-    except Exception as e:
-        st.error(f"Errore caricamento storico: {e}")
-        return False
+    
+    return operation
+
+@timed()
+def save_all_data(force=False):
+    """Salva tutto (solo le collezioni modificate, salvo force=True)"""
+    publish_collections()
+    operations = [make_save_operation(key, force) for key in COLLECTIONS]
+    return run_tab_operations([op for op in operations if op])
+
+@st.cache_resource
+def get_journal(athlete):
+    """Giornale locale delle modifiche di un atleta, condiviso tra le sessioni (None se disattivato)"""
+    if not JOURNAL_PATH:
+        return None
+    return MutationJournal(athlete_path(JOURNAL_PATH, athlete), fsync=st.secrets.get("journal_fsync", False))
+
+class AthleteData:
+    """Dati caricati di un atleta, condivisi da tutte le sue sessioni.
+
+    Collezioni, hash sincronizzati, repository dello storico e writer sono gli
+    stessi oggetti per ogni sessione dell'atleta: si modificano con lock acquisito.
+    Fa eccezione il template, modificato in place dai widget: ogni sessione ne
+    usa una copia e quello condiviso viene solo sostituito.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.collections = None  # None finché non inizializzate
+        self.loaded = False
+        self.synced_hashes = {}
+        self.history_repository = None
+        self.history_hash_source = None  # (repository, versione, hash) dell'ultimo hash calcolato
+        self.writer = None
+
+@st.cache_resource
+def get_athlete_data(athlete):
+    """Dati di un atleta condivisi tra le sessioni (caricati al primo accesso)"""
+    return AthleteData()
+
+def set_collection(key, value):
+    """Sostituisce una collezione per la sessione e per le altre sessioni dell'atleta"""
+    get_athlete_data(current_athlete()).collections[key] = value
+    if key == 'workout_template':
+        st.session_state.template_source = (value, compute_data_hash(value))
+        value = copy.deepcopy(value)
+    st.session_state[key] = value
+
+def publish_collections():
+    """Rende visibili alle altre sessioni dell'atleta le collezioni cambiate da questa sessione"""
+    shared = get_athlete_data(current_athlete())
+    with shared.lock:
+        for key in COLLECTIONS:
+            value = st.session_state[key]
+            if key == 'workout_template':
+                value_hash = compute_data_hash(value)
+                if value_hash != st.session_state.template_source[1]:
+                    # Il template condiviso non si modifica mai in place: ne va una copia
+                    shared.collections[key] = copy.deepcopy(value)
+                    st.session_state.template_source = (shared.collections[key], value_hash)
+            elif value is not shared.collections[key]:
+                # Collezioni sostituite da questa sessione (es. data inizio scheda)
+                shared.collections[key] = value
 
-def save_all_data():
-    """Salva tutto"""
-    success = True
-    success = save_template_to_sheets() and success
-    success = save_history_to_sheets() and success
-    success = save_config_to_sheets() and success
-    success = save_weight_calories_to_sheets() and success
-    return success
+def get_writer():
+    """Writer differito dell'atleta corrente, condiviso dalle sue sessioni"""
+    shared = get_athlete_data(current_athlete())
+    with shared.lock:
+        if shared.writer is None:
+            save = timed('backend.save')(get_storage_backend(current_athlete()).save)
+            shared.writer = WriteBehindWriter(save, get_journal(current_athlete()))
+        return shared.writer
 
+def snapshot_collection(key, value):
+    """Copia di una collezione da passare al writer in background.
+    
+    I record dello storico e del peso vengono sostituiti, mai modificati in
+    place: basta copiare le liste (sessioni comprese). Il template, modificato
+    in place dai widget, viene copiato per intero.
+    """
+    if key == 'workout_history':
+        return [Session(s.data, s.giorno, s.settimana, list(s.esercizi)) for s in value]
+    if key == 'weight_calories_history':
+        return list(value)
+    return copy.deepcopy(value)
+
+def queue_hash(key):
+    """Hash di una collezione; quello dello storico si ricalcola solo se il repository è cambiato"""
+    value = st.session_state[key]
+    shared = get_athlete_data(current_athlete())
+    repository = shared.history_repository
+    if key != 'workout_history' or repository is None or repository.sessions is not value:
+        return compute_data_hash(value)
+    source = shared.history_hash_source
+    if source is None or source[0] is not repository or source[1] != repository.version:
+        source = shared.history_hash_source = (repository, repository.version, compute_data_hash(value))
+    return source[2]
+
+def queue_save_all_data():
+    """Accoda il salvataggio delle collezioni modificate senza attendere la rete"""
+    if not WRITE_BEHIND:
+        return save_all_data()
+    
+    writer = get_writer()
+    journal = get_journal(current_athlete())
+    shared = get_athlete_data(current_athlete())
+    with shared.lock:
+        publish_collections()
+        for key in COLLECTIONS:
+            value_hash = queue_hash(key)
+            if st.session_state.synced_hashes.get(key) != value_hash:
+                value = snapshot_collection(key, st.session_state[key])
+                seq = None
+                if journal is not None:
+                    # Le modifiche fatte con mutate() sono già nel giornale
+                    seq = journal.last_seq(key) if key in MUTATED_COLLECTIONS else journal.append(key, 'set', value)
+                writer.enqueue(key, value, seq)
+                st.session_state.synced_hashes[key] = value_hash
+    return True
+
+@timed()
+def flush_pending_saves():
+    """Salva subito le modifiche accodate; True se tutto è sincronizzato"""
+    if not WRITE_BEHIND:
+        return save_all_data()
+    
+    queue_save_all_data()
+    return get_writer().flush()
+
+@st.cache_resource
+def get_snapshot(athlete):
+    """Snapshot locale dei dati di un atleta, condiviso tra le sessioni (None se disattivato)"""
+    if not SNAPSHOT_PATH:
+        return None
+    return LocalSnapshot(athlete_path(SNAPSHOT_PATH, athlete))
+
+def replay_journal():
+    """Riapplica ai dati caricati le modifiche del giornale non ancora sincronizzate e le accoda"""
+    journal = get_journal(current_athlete())
+    if not WRITE_BEHIND or journal is None:
+        return
+    
+    writer = get_writer()
+    with get_athlete_data(current_athlete()).lock:
+        entries = journal.pending()
+        for _, key, op, value in entries:
+            apply_mutation(key, op, value)
+        
+        # Anche le collezioni già uguali vanno risalvate, per confermarne le voci
+        for key in {key for _, key, _, _ in entries}:
+            writer.enqueue(key, snapshot_collection(key, st.session_state[key]), journal.last_seq(key))
+            st.session_state.synced_hashes[key] = queue_hash(key)
+
+def apply_loaded_data(data):
+    """Copia in session_state le collezioni caricate, segnandole come sincronizzate"""
+    for key, value in data.items():
+        if key == 'workout_template':
+            value = {day: value.get(day, []) for day in GIORNI}
+        set_collection(key, value)
+        mark_synced(key)
+
+@timed()
 def load_all_data():
     """Carica tutto"""
-    success = True
-    success = load_template_from_sheets() and success
-    success = load_history_from_sheets() and success
-    success = load_config_from_sheets() and success
-    success = load_weight_calories_from_sheets() and success
-    return success
-
-def calculate_current_week(start_date_str, current_date):
-    """Calcola la settimana corrente (1-6) basandosi sulla data di inizio"""
     try:
-        start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-        days_since_monday = start_date.weekday()
-        monday_of_start_week = start_date - timedelta(days=days_since_monday)
-        delta_days = (current_date - monday_of_start_week).days
-        week_number = (delta_days // 7) % 6 + 1
-        return week_number
-    except:
-        return 1
+        with span('backend.load_all'):
+            data = get_storage_backend(current_athlete()).load_all()
+    except Exception as e:
+        st.error(f"Errore caricamento dati: {e}")
+        data = None
+    
+    with get_athlete_data(current_athlete()).lock:
+        if data is not None:
+            apply_loaded_data(data)
+            if get_snapshot(current_athlete()):
+                get_snapshot(current_athlete()).save(data)
+        
+        # Le modifiche non ancora sincronizzate sono più recenti del backend:
+        # riapplicate ai dati caricati restano visibili e il writer le salva
+        replay_journal()
+    
+    return data is not None
 
-def init_session_state():
-    """Inizializza la struttura dati"""
+@timed()
+def start_from_snapshot():
+    """Mostra subito i dati dello snapshot locale e rilegge il backend in background.
+
+    Ritorna False se non c'è uno snapshot da cui partire.
+    """
+    snapshot = get_snapshot(current_athlete())
+    data = snapshot.load() if snapshot else None
+    if data is None:
+        return False
     
-    if 'workout_template' not in st.session_state:
-        st.session_state.workout_template = {day: [] for day in GIORNI}
+    apply_loaded_data(data)
+    replay_journal()
     
-    if 'workout_history' not in st.session_state:
-        st.session_state.workout_history = []
+    backend = get_storage_backend(current_athlete())
+    writer = get_writer() if WRITE_BEHIND else None
+    result = {}
+    
+    def revalidate():
+        # Prima le modifiche in sospeso, poi la rilettura completa
+        if writer:
+            writer.flush()
+        try:
+            with span('backend.load_all'):
+                result['data'] = backend.load_all()
+        except Exception as e:
+            result['error'] = str(e)
     
-    if 'data_inizio_scheda' not in st.session_state:
-        st.session_state.data_inizio_scheda = "2025-11-03"
+    thread = threading.Thread(target=revalidate, daemon=True)
+    add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+    st.session_state.revalidation = {
+        'thread': thread,
+        'result': result,
+        'hashes': dict(st.session_state.synced_hashes)
+    }
+    return True
 
-    if 'weight_calories_history' not in st.session_state:
-        st.session_state.weight_calories_history = []
+@timed()
+def finish_revalidation():
+    """Applica la rilettura in background, se terminata, sostituendo i dati solo se sono cambiati"""
+    revalidation = st.session_state.get('revalidation')
+    if revalidation is None or revalidation['thread'].is_alive():
+        # Non si attende la rete: se ne occupa un rerun successivo
+        return
+    
+    del st.session_state['revalidation']
+    data = revalidation['result'].get('data')
+    if data is None:
+        st.session_state.revalidation_error = revalidation['result'].get('error', "caricamento non riuscito")
+        return
+    
+    get_snapshot(current_athlete()).save(data)
+    pending = get_writer().pending() if WRITE_BEHIND else {}
+    changed = False
+    with get_athlete_data(current_athlete()).lock:
+        for key, value in data.items():
+            if key == 'workout_template':
+                value = {day: value.get(day, []) for day in GIORNI}
+            current_hash = compute_data_hash(st.session_state[key])
+            # Le collezioni modificate nel frattempo restano quelle locali
+            if key in pending or current_hash != revalidation['hashes'].get(key):
+                continue
+            if compute_data_hash(value) != current_hash:
+                set_collection(key, value)
+                changed = True
+            mark_synced(key)
+    
+    if changed:
+        st.rerun()
+
+def bind_athlete_data(shared):
+    """Collega session_state ai dati condivisi dell'atleta"""
+    for key in COLLECTIONS:
+        if key != 'workout_template':
+            st.session_state[key] = shared.collections[key]
+    # Hash dell'ultimo stato sincronizzato per ogni collezione
+    st.session_state.synced_hashes = shared.synced_hashes
+    
+    template = shared.collections['workout_template']
+    source = st.session_state.get('template_source')
+    if source is not None and source[0] is template:
+        return
+    # Template sostituito da un'altra sessione: se qui non ci sono modifiche non
+    # salvate si riparte dal nuovo, ricreando i widget (altrimenti i loro valori
+    # riscriverebbero quelli vecchi); se ci sono, vince il prossimo salvataggio
+    if source is None or compute_data_hash(st.session_state.workout_template) == source[1]:
+        st.session_state.workout_template = copy.deepcopy(template)
+        for widget_key in [k for k in st.session_state if k.startswith('tpl_')]:
+            del st.session_state[widget_key]
+    st.session_state.template_source = (template, compute_data_hash(template))
+
+def init_session_state():
+    """Inizializza la struttura dati (condivisa dalle sessioni dello stesso atleta)"""
+    shared = get_athlete_data(current_athlete())
+    with shared.lock:
+        if shared.collections is None:
+            shared.collections = {
+                'workout_template': {day: [] for day in GIORNI},
+                'workout_history': [],
+                'data_inizio_scheda': "2025-11-03",
+                'weight_calories_history': [],
+            }
         
-    # Carica dati all'avvio
-    if 'data_loaded' not in st.session_state:
-        load_all_data()
-        st.session_state.data_loaded = True
+        # Ogni rerun riparte dai dati condivisi: le modifiche delle altre sessioni sono visibili
+        bind_athlete_data(shared)
+        
+        # Carica i dati al primo accesso all'atleta: dallo snapshot locale se
+        # c'è, altrimenti dal backend (ritentato dalle nuove sessioni se fallisce)
+        if not shared.loaded and 'data_loaded' not in st.session_state:
+            shared.loaded = start_from_snapshot() or load_all_data()
+            st.session_state.data_loaded = True
 
 def add_exercise_to_template(day):
     """Aggiunge un esercizio al template"""
@@ -365,56 +896,167 @@ def delete_exercise_from_template(day, idx):
     """Elimina un esercizio dal template"""
     st.session_state.workout_template[day].pop(idx)
 
+def get_history_repository():
+    """Repository dello storico dell'atleta (ricostruito se lo storico è stato sostituito)"""
+    shared = get_athlete_data(current_athlete())
+    with shared.lock:
+        repository = shared.history_repository
+        if repository is None or repository.sessions is not st.session_state.workout_history:
+            repository = HistoryRepository(st.session_state.workout_history)
+            shared.history_repository = repository
+        return repository
+
+# Collezioni modificate solo con mutate(): il giornale ne registra le singole
+# modifiche, le altre (template, data inizio) vi finiscono intere a ogni salvataggio
+MUTATED_COLLECTIONS = {'workout_history', 'weight_calories_history'}
+
+def apply_mutation(key, op, value):
+    """Applica una modifica a una collezione (riapplicarla non cambia il risultato)"""
+    if op == 'upsert_exercise':
+        get_history_repository().upsert_exercise(value.data, value.giorno, value.settimana, value.esercizi[0])
+    elif op == 'replace_date':
+        get_history_repository().replace_date(value.data, value.giorno, value.settimana, list(value.esercizi))
+    elif op == 'put_weight':
+        # Una sola misura per data
+        set_collection(key, [
+            e for e in st.session_state.weight_calories_history if e.data != value.data
+        ] + [value])
+    else:
+        # 'set': il valore resta anche nel giornale, la collezione ne usa una copia
+        set_collection(key, copy.deepcopy(value))
+
+def mutate(key, op, value):
+    """Registra una modifica nel giornale (se attivo) e la applica ai dati dell'atleta"""
+    journal = get_journal(current_athlete()) if WRITE_BEHIND else None
+    with get_athlete_data(current_athlete()).lock:
+        if journal is not None:
+            journal.append(key, op, value)
+        apply_mutation(key, op, value)
+
 def save_workout_session(day, date_str, week_number, exercises_data):
     """Salva una sessione di allenamento completata"""
-    # Rimuovi eventuali allenamenti già esistenti con la stessa data
-    st.session_state.workout_history = [
-        s for s in st.session_state.workout_history 
-        if s['data'] != date_str
-    ]
+    # Rimuove eventuali allenamenti già esistenti con la stessa data
+    mutate('workout_history', 'replace_date', Session(date_str, day, week_number, list(exercises_data)))
+
+def save_exercise_result(day, date_str, week_number, exercise_data):
+    """Registra un esercizio nella sessione del giorno (creandola se serve)"""
+    mutate('workout_history', 'upsert_exercise', Session(date_str, day, week_number, [exercise_data]))
+
+@timed()
+def get_history_frame():
+    """Tabella colonnare dello storico, ricostruita solo quando i dati cambiano"""
+    repository = get_history_repository()
+    source = st.session_state.get('history_frame_source')
+    if source is None or source[0] is not repository or source[1] != repository.version:
+        st.session_state.history_frame = build_history_frame(repository.sessions)
+        st.session_state.history_frame_source = (repository, repository.version)
+    return st.session_state.history_frame
+
+@timed()
+def get_weight_calories_frame():
+    """Tabella peso/calorie con valori numerici, ricostruita solo quando i dati cambiano"""
+    # Ogni modifica sostituisce la lista o ne cambia la lunghezza
+    entries = st.session_state.weight_calories_history
+    source = st.session_state.get('weight_calories_frame_source')
+    if source is None or source[0] is not entries or source[1] != len(entries):
+        st.session_state.weight_calories_frame = build_weight_calories_frame(entries)
+        st.session_state.weight_calories_frame_source = (entries, len(entries))
+    return st.session_state.weight_calories_frame
+
+def history_saved():
+    """True se lo storico in memoria è già tutto salvato sul backend"""
+    if st.session_state.synced_hashes.get('workout_history') != queue_hash('workout_history'):
+        return False
+    writer = get_athlete_data(current_athlete()).writer
+    return writer is None or 'workout_history' not in writer.pending()
+
+@timed()
+def get_exercise_frame(exercise_name):
+    """Righe della tabella dello storico per un esercizio, ordinate per data.
     
-    # Aggiungi il nuovo allenamento
-    session = {
-        'data': date_str,
-        'giorno': day,
-        'settimana': week_number,
-        'esercizi': exercises_data
-    }
-    st.session_state.workout_history.append(session)
+    Con un backend locale e lo storico già salvato legge dal backend solo le
+    righe e le colonne dell'esercizio, senza costruire la tabella completa.
+    """
+    repository = get_history_repository()
+    cache = st.session_state.get('exercise_frames')
+    if cache is None or cache['source'][0] is not repository or cache['source'][1] != repository.version:
+        # Nuova versione dello storico: le righe filtrate vanno ricalcolate
+        cache = st.session_state.exercise_frames = {'source': (repository, repository.version), 'frames': {}}
+    key = exercise_name.lower()
+    if key not in cache['frames']:
+        backend = get_storage_backend(current_athlete())
+        if backend.local and history_saved():
+            with span('backend.load_history_rows'):
+                rows = backend.load_history_rows(EXERCISE_ROW_COLUMNS, exercise_name)
+            cache['frames'][key] = build_exercise_frame(rows)
+        else:
+            frame = get_history_frame()
+            rows = frame[frame['esercizio_key'] == key]
+            cache['frames'][key] = rows.sort_values('data', kind='stable')
+    return cache['frames'][key]
+
+@st.cache_resource
+def get_figure_cache():
+    """Cache dei grafici condivisa tra rerun e sessioni"""
+    from charts import FigureCache
+    return FigureCache(FIGURE_CACHE_SIZE)
+
+def get_figure(view, exercise, data, build):
+    """Grafico di una vista, ricostruito solo se il contenuto dei dati cambia"""
+    from charts import frame_content_hash
+    # L'hash viene ricalcolato solo quando cambia la tabella di origine
+    hashes = st.session_state.setdefault('figure_hashes', {})
+    cached = hashes.get((view, exercise))
+    if cached is None or cached[0] is not data:
+        cached = hashes[(view, exercise)] = (data, frame_content_hash(data))
+    return get_figure_cache().get_or_build((view, exercise, cached[1]), lambda: timed(f"grafico {view}")(build)(data))
 
+@timed()
 def get_exercise_history(exercise_name):
     """Ottiene lo storico di un esercizio specifico"""
-    history = []
-    for session in st.session_state.workout_history:
-        for ex in session['esercizi']:
-            if ex['nome'].lower() == exercise_name.lower():
-                history.append({
-                    'data': session['data'],
-                    'giorno': session['giorno'],
-                    'settimana': session.get('settimana', 1),
-                    'peso': ex.get('peso', ''),
-                    'serie_target': ex.get('serie_target', ''),
-                    'rip_target': ex.get('rip_target', ''),
-                    'serie_eseguite': ex.get('serie_eseguite', ''),
-                    'rip_eseguite': ex.get('rip_eseguite', ''),
-                    'recupero': ex.get('recupero', ''),
-                    'completato': ex.get('completato', False)
-                })
-    return sorted(history, key=lambda x: x['data'])
+    return get_history_repository().exercises.get(exercise_name)
 
+@timed()
 def get_last_weight_for_exercise(exercise_name):
     """Ottiene l'ultimo peso utilizzato per un esercizio"""
-    history = get_exercise_history(exercise_name)
-    if history:
-        for h in reversed(history):
-            if h['peso'] and h['peso'].strip():
-                return h['peso']
-    return None
+    return get_history_repository().exercises.last_weight(exercise_name)
+
+@timed()
+def get_training_load():
+    """Rollup dei carichi (volume, tonnellaggio, 1RM stimato), aggiornati a ogni salvataggio"""
+    return get_history_repository().training_load
+
+# Accesso: con più atleti configurati si sceglie l'atleta (e si verifica il PIN)
+athletes = get_athletes()
+if athletes and 'athlete' not in st.session_state:
+    st.title("💪 Workout Tracker")
+    with st.form("login_form"):
+        athlete = st.selectbox(
+            "Atleta", list(athletes),
+            format_func=lambda athlete_id: athletes[athlete_id].get('name', athlete_id)
+        )
+        pin = st.text_input("PIN", type="password")
+        if st.form_submit_button("Entra"):
+            expected_pin = str(athletes[athlete].get('pin', ''))
+            if expected_pin and not hmac.compare_digest(pin.encode('utf-8'), expected_pin.encode('utf-8')):
+                st.error("❌ PIN non corretto")
+            else:
+                st.session_state.athlete = athlete
+                st.rerun()
+    st.stop()
 
 # Inizializza
 init_session_state()
     
 st.sidebar.title("💪 Workout Tracker")
+if athletes:
+    st.sidebar.caption(f"👤 Atleta: {get_athlete_config(current_athlete()).get('name', current_athlete())}")
+    if st.sidebar.button("🔁 Cambia atleta"):
+        # Le modifiche non ancora salvate restano comunque nel giornale dell'atleta
+        if WRITE_BEHIND:
+            get_writer().flush()
+        st.session_state.clear()
+        st.rerun()
 st.sidebar.markdown("---")
 
 # Configurazione Data Inizio Scheda
@@ -432,7 +1074,7 @@ new_start_date = st.sidebar.date_input(
 
 if new_start_date.strftime("%Y-%m-%d") != st.session_state.data_inizio_scheda:
     st.session_state.data_inizio_scheda = new_start_date.strftime("%Y-%m-%d")
-    save_config_to_sheets()
+    queue_save_all_data()
 
 # Calcola il lunedì della settimana di inizio
 days_since_monday = data_corrente.weekday()
@@ -458,17 +1100,54 @@ st.sidebar.markdown("---")
 col1, col2 = st.sidebar.columns(2)
 if col1.button("💾 Salva"):
     with st.spinner("Salvataggio..."):
-        if save_all_data():
+        if flush_pending_saves():
             st.sidebar.success("✅ Salvato!")
         else:
             st.sidebar.error("❌ Errore")
 
 if col2.button("🔄 Ricarica"):
     with st.spinner("Caricamento..."):
+        # Le modifiche già accodate vanno scritte prima di rileggere
+        if WRITE_BEHIND:
+            get_writer().flush()
+        invalidate_sheets_cache(current_athlete())
         if load_all_data():
             st.sidebar.success("✅ Caricato!")
             st.rerun()
 
+if WRITE_BEHIND:
+    writer = get_writer()
+    if writer.status == WriteBehindWriter.PENDING:
+        st.sidebar.caption("🟡 Salvataggio in corso...")
+    elif writer.status == WriteBehindWriter.FAILED:
+        st.sidebar.caption(f"🔴 Salvataggio non riuscito: {writer.last_error} (usa 💾 Salva per riprovare)")
+    else:
+        st.sidebar.caption("🟢 Dati sincronizzati")
+
+# Solo se Google Sheets è in uso: il gateway (e con lui gspread) si importa al primo accesso
+sheets_stats = get_sheets_gateway().stats.snapshot() if 'sheets_gateway' in sys.modules else []
+if sheets_stats:
+    with st.sidebar.expander("📡 Richieste Google Sheets"):
+        st.dataframe(pd.DataFrame(sheets_stats), use_container_width=True, hide_index=True)
+
+@st.fragment(run_every=1)
+def revalidation_status():
+    """Stato della rilettura in background: a rilettura terminata riesegue la pagina per applicarla"""
+    revalidation = st.session_state.get('revalidation')
+    if revalidation is not None and not revalidation['thread'].is_alive():
+        st.rerun()
+    st.caption("⏳ Dati dallo snapshot locale, aggiornamento in corso...")
+
+if 'revalidation' in st.session_state:
+    # Rilettura già terminata: la applica finish_revalidation a fine pagina
+    if st.session_state.revalidation['thread'].is_alive():
+        with st.sidebar:
+            revalidation_status()
+elif 'revalidation_error' in st.session_state:
+    st.sidebar.caption(f"🔴 Dati dallo snapshot locale, backend non raggiungibile: {st.session_state.revalidation_error}")
+
+page_start = time.perf_counter()
+
 # --- SCHEDA ALLENAMENTO (Template) ---
 if menu == "📋 Scheda Allenamento":
     st.title("📋 Scheda Allenamento Settimanale (6 Settimane)")
@@ -575,9 +1254,8 @@ elif menu == "✍️ Registra Allenamento":
     if not template_exercises:
         st.warning(f"⚠️ Nessun esercizio configurato per {selected_day}. Vai in 'Scheda Allenamento' per configurare gli esercizi.")
     else:
-        # Carica gli esercizi già salvati per questa data (se esistono)
-        existing_session = next((s for s in st.session_state.workout_history if s['data'] == workout_date.strftime("%Y-%m-%d") and s['giorno'] == selected_day), None)
-        existing_exercises = {ex['nome']: ex for ex in existing_session['esercizi']} if existing_session else {}
+        history_repository = get_history_repository()
+        workout_date_str = workout_date.strftime("%Y-%m-%d")
         
         for idx, template_ex in enumerate(template_exercises):
             # Migrazione dati vecchi
@@ -593,7 +1271,10 @@ elif menu == "✍️ Registra Allenamento":
             rip_target = template_ex['ripetizioni_settimane'][week_idx]
             
             # Recupera dati esistenti se presenti
-            existing_ex = existing_exercises.get(template_ex['nome'], {})
+            existing_ex = (
+                history_repository.get_exercise(workout_date_str, selected_day, template_ex['nome'])
+                or ExerciseRecord(serie_eseguite=serie_target)
+            )
             
             with st.form(f"workout_form_{selected_day}_{workout_date}_{idx}"):
                 st.subheader(f"🏋️ {template_ex['nome']}")
@@ -608,7 +1289,7 @@ elif menu == "✍️ Registra Allenamento":
                 with col1:
                     peso = st.text_input(
                         "Peso utilizzato",
-                        value=existing_ex.get('peso', ''),
+                        value=existing_ex.peso,
                         placeholder=peso_placeholder,
                         key=f"reg_peso_{idx}"
                     )
@@ -616,21 +1297,21 @@ elif menu == "✍️ Registra Allenamento":
                 with col2:
                     serie_fatte = st.text_input(
                         "Serie completate",
-                        value=existing_ex.get('serie_eseguite', serie_target),
+                        value=existing_ex.serie_eseguite,
                         key=f"reg_serie_{idx}"
                     )
                 
                 with col3:
                     rip_fatte = st.text_input(
                         "Ripetizioni per serie",
-                        value=existing_ex.get('rip_eseguite', ''),
+                        value=existing_ex.rip_eseguite,
                         placeholder="4,4,4,4,4",
                         key=f"reg_rip_{idx}"
                     )
                 
                 completato = st.checkbox(
                     "✅ Obiettivo raggiunto (serie e ripetizioni completate)",
-                    value=existing_ex.get('completato', False),
+                    value=existing_ex.completato,
                     key=f"reg_comp_{idx}"
                 )
                 
@@ -638,39 +1319,23 @@ elif menu == "✍️ Registra Allenamento":
                 
                 if submitted:
                     # Crea o aggiorna la sessione di allenamento
-                    exercise_data = {
-                        'nome': template_ex['nome'],
-                        'serie_target': serie_target,
-                        'rip_target': rip_target,
-                        'recupero': template_ex['recupero'],
-                        'peso': peso,
-                        'serie_eseguite': serie_fatte,
-                        'rip_eseguite': rip_fatte,
-                        'completato': completato
-                    }
+                    exercise_data = ExerciseRecord(
+                        nome=template_ex['nome'],
+                        serie_target=serie_target,
+                        rip_target=rip_target,
+                        recupero=template_ex['recupero'],
+                        peso=peso,
+                        serie_eseguite=serie_fatte,
+                        rip_eseguite=rip_fatte,
+                        completato=completato,
+                        peso_kg=parse_kg(peso)
+                    )
                     
                     # Trova o crea la sessione per questa data
                     date_str = workout_date.strftime("%Y-%m-%d")
-                    session_idx = next((i for i, s in enumerate(st.session_state.workout_history) if s['data'] == date_str and s['giorno'] == selected_day), None)
-                    
-                    if session_idx is not None:
-                        # Aggiorna esercizio esistente o aggiungine uno nuovo
-                        ex_idx = next((i for i, ex in enumerate(st.session_state.workout_history[session_idx]['esercizi']) if ex['nome'] == template_ex['nome']), None)
-                        if ex_idx is not None:
-                            st.session_state.workout_history[session_idx]['esercizi'][ex_idx] = exercise_data
-                        else:
-                            st.session_state.workout_history[session_idx]['esercizi'].append(exercise_data)
-                    else:
-                        # Crea nuova sessione
-                        new_session = {
-                            'data': date_str,
-                            'giorno': selected_day,
-                            'settimana': week_number,
-                            'esercizi': [exercise_data]
-                        }
-                        st.session_state.workout_history.append(new_session)
+                    save_exercise_result(selected_day, date_str, week_number, exercise_data)
                     
-                    save_all_data()
+                    queue_save_all_data()
                     st.success(f"✅ Esercizio '{template_ex['nome']}' salvato!")
                     st.rerun()
             
@@ -685,43 +1350,84 @@ elif menu == "📅 Storico":
     else:
         col1, col2 = st.columns(2)
         with col1:
-            giorni_disponibili = ["Tutti"] + sorted(list(set([s['giorno'] for s in st.session_state.workout_history])))
+            giorni_disponibili = ["Tutti"] + sorted(get_history_frame()['giorno'].dropna().unique().tolist())
             filtro_giorno = st.selectbox("Filtra per giorno", giorni_disponibili)
         
         with col2:
             settimane_disponibili = ["Tutte"] + [f"Settimana {i}" for i in range(1, 7)]
             filtro_settimana = st.selectbox("Filtra per settimana", settimane_disponibili)
         
-        history = st.session_state.workout_history
+        frame = get_history_frame()
+        mask = pd.Series(True, index=frame.index)
         if filtro_giorno != "Tutti":
-            history = [s for s in history if s['giorno'] == filtro_giorno]
+            mask &= frame['giorno'] == filtro_giorno
         
         if filtro_settimana != "Tutte":
             week_num = int(filtro_settimana.split()[1])
-            history = [s for s in history if s.get('settimana', 1) == week_num]
+            mask &= frame['settimana'] == week_num
         
-        history = sorted(history, key=lambda x: x['data'], reverse=True)
+        history = frame[mask].sort_values('data', ascending=False, kind='stable')
         
-        for session in history:
-            week_label = session.get('settimana', 1)
-            with st.expander(f"📆 {session['data']} - {session['giorno']} (Settimana {week_label})"):
-                data = []
-                for ex in session['esercizi']:
-                    status = "✅" if ex['completato'] else "❌"
-                    data.append({
-                        "Status": status,
-                        "Esercizio": ex['nome'],
-                        "Target": f"{ex['serie_target']}x{ex['rip_target']}",
-                        "Eseguito": f"{ex['serie_eseguite']}x{ex['rip_eseguite']}",
-                        "Peso": ex['peso'],
-                        "Recupero": ex['recupero']
-                    })
-                
-                df = pd.DataFrame(data)
-                st.dataframe(df, use_container_width=True, hide_index=True)
+        vista = st.radio("Visualizzazione", ["Per sessione", "Tabella unica"], horizontal=True)
+        
+        if vista == "Tabella unica":
+            # Tutte le sessioni filtrate in un'unica tabella
+            cerca = st.text_input("Cerca esercizio")
+            rows = history[history['esercizio'].notna()]
+            if cerca.strip():
+                rows = rows[rows['esercizio_key'].str.contains(cerca.strip().lower(), regex=False)]
+            
+            df = pd.DataFrame({
+                "Data": rows['data_testo'],
+                "Giorno": rows['giorno'],
+                "Settimana": rows['settimana'],
+                "Status": rows['completato'].map({True: "✅", False: "❌"}),
+                "Esercizio": rows['esercizio'],
+                "Target": rows['serie_target'] + "x" + rows['rip_target'],
+                "Eseguito": rows['serie_eseguite'] + "x" + rows['rip_eseguite'],
+                "Peso": rows['peso'],
+                "Recupero": rows['recupero']
+            })
+            st.caption(f"{len(df)} esercizi")
+            st.dataframe(df, use_container_width=True, hide_index=True)
+        else:
+            # Numero progressivo della sessione, dalla più recente
+            # Raggruppate per data come inserita: le date non valide (NaT) restano sessioni distinte
+            session_ids = history.groupby(['data_testo', 'giorno'], sort=False, dropna=False, observed=True).ngroup()
+            session_count = int(session_ids.max()) + 1 if len(session_ids) else 0
+            page_count = max(1, -(-session_count // STORICO_PAGE_SIZE))
+            
+            # Con filtri più restrittivi la pagina salvata può non esistere più
+            if st.session_state.get('storico_page', 1) > page_count:
+                st.session_state.storico_page = page_count
+            page = st.number_input("Pagina", min_value=1, max_value=page_count, step=1, key='storico_page')
+            
+            first = (page - 1) * STORICO_PAGE_SIZE
+            last = min(first + STORICO_PAGE_SIZE, session_count)
+            st.caption(f"Sessioni {first + 1}-{last} di {session_count}" if session_count else "Nessuna sessione")
+            
+            # Solo le sessioni della pagina vengono trasformate in tabelle
+            visible = history[(session_ids >= first) & (session_ids < last)]
+            table = pd.DataFrame({
+                "Status": visible['completato'].map({True: "✅", False: "❌"}),
+                "Esercizio": visible['esercizio'],
+                "Target": visible['serie_target'] + "x" + visible['rip_target'],
+                "Eseguito": visible['serie_eseguite'] + "x" + visible['rip_eseguite'],
+                "Peso": visible['peso'],
+                "Recupero": visible['recupero']
+            })
+            has_exercise = visible['esercizio'].notna()
+            
+            for (session_date, giorno), rows in visible.groupby(['data_testo', 'giorno'], sort=False, dropna=False, observed=True):
+                week_label = rows['settimana'].iloc[0]
+                with st.expander(f"📆 {session_date} - {giorno} (Settimana {week_label})"):
+                    df = table.loc[rows.index[has_exercise[rows.index]]]
+                    st.dataframe(df, use_container_width=True, hide_index=True)
 
 # --- PROGRESSIONE ---
 elif menu == "📈 Progressione":
+    from charts import build_exercise_weight_figure, build_completion_figure, build_training_load_figure
+    
     st.title("📈 Progressione Esercizi")
     
     all_exercises = set()
@@ -735,109 +1441,85 @@ elif menu == "📈 Progressione":
     else:
         selected_exercise = st.selectbox("Seleziona Esercizio", sorted(all_exercises))
         
-        history = get_exercise_history(selected_exercise)
+        history = get_exercise_frame(selected_exercise)
         
-        if not history:
+        if history.empty:
             st.warning(f"Nessun allenamento registrato per '{selected_exercise}'")
         else:
-            dates = [h['data'] for h in history]
-            weights = []
-            completions = []
-            weeks = [h.get('settimana', 1) for h in history]
-            
-            for h in history:
-                try:
-                    peso_val = float(h['peso'].replace('kg', '').replace('Kg', '').strip())
-                    weights.append(peso_val)
-                except:
-                    weights.append(None)
-                
-                completions.append(1 if h['completato'] else 0)
+            dates = history['data']
+            weeks = history['settimana']
             
             st.subheader("📊 Progressione Peso")
-            fig_weight = go.Figure()
-            
-            valid_weights = [(d, w, wk) for d, w, wk in zip(dates, weights, weeks) if w is not None]
-            if valid_weights:
-                valid_dates, valid_weight_values, valid_weeks = zip(*valid_weights)
-                
-                # Colora i punti in base alla settimana
-                colors = [f'rgb({40 + wk*30}, {100 + wk*20}, {200 - wk*20})' for wk in valid_weeks]
-                
-                fig_weight.add_trace(go.Scatter(
-                    x=valid_dates,
-                    y=valid_weight_values,
-                    mode='lines+markers',
-                    name='Peso',
-                    line=dict(color='#1f77b4', width=3),
-                    marker=dict(size=10, color=colors),
-                    text=[f"Settimana {wk}" for wk in valid_weeks],
-                    hovertemplate='<b>%{x}</b><br>Peso: %{y:.1f} kg<br>%{text}<extra></extra>'
-                ))
-                
-                fig_weight.update_layout(
-                    xaxis_title="Data",
-                    yaxis_title="Peso (kg)",
-                    hovermode='x unified',
-                    template='plotly_white',
-                    height=400
-                )
-                
+            valid_weight_values = history['peso_kg'].dropna()
+            if not valid_weight_values.empty:
+                fig_weight = get_figure('progressione_peso', selected_exercise, history, build_exercise_weight_figure)
                 st.plotly_chart(fig_weight, use_container_width=True)
                 
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.metric("Peso Iniziale", f"{valid_weight_values[0]:.1f} kg")
+                    st.metric("Peso Iniziale", f"{valid_weight_values.iloc[0]:.1f} kg")
                 with col2:
-                    st.metric("Peso Attuale", f"{valid_weight_values[-1]:.1f} kg")
+                    st.metric("Peso Attuale", f"{valid_weight_values.iloc[-1]:.1f} kg")
                 with col3:
-                    diff = valid_weight_values[-1] - valid_weight_values[0]
+                    diff = valid_weight_values.iloc[-1] - valid_weight_values.iloc[0]
                     st.metric("Incremento", f"{diff:+.1f} kg")
             else:
                 st.info("Nessun dato di peso registrato")
             
             st.subheader("✅ Tasso di Completamento")
-            fig_comp = go.Figure()
-            
-            fig_comp.add_trace(go.Bar(
-                x=dates,
-                y=completions,
-                marker_color=['#2ecc71' if c == 1 else '#e74c3c' for c in completions],
-                name='Completato',
-                text=[f"S{wk}" for wk in weeks],
-                textposition='outside'
-            ))
+            fig_comp = get_figure('progressione_completamento', selected_exercise, history, build_completion_figure)
+            st.plotly_chart(fig_comp, use_container_width=True)
             
-            fig_comp.update_layout(
-                xaxis_title="Data",
-                yaxis_title="Completato",
-                yaxis=dict(tickmode='linear', tick0=0, dtick=1),
-                template='plotly_white',
-                height=300,
-                showlegend=False
-            )
+            st.subheader("🏋️ Carico di Allenamento")
+            training_load = get_training_load()
+            load_weeks = training_load.exercise_weeks(selected_exercise)
+            if load_weeks['volume'].sum() > 0:
+                fig_load = get_figure('carico_settimanale', selected_exercise, load_weeks, build_training_load_figure)
+                st.plotly_chart(fig_load, use_container_width=True)
+                
+                valid_e1rm = load_weeks['e1rm'].dropna()
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("1RM Stimato", f"{valid_e1rm.iloc[-1]:.1f} kg" if not valid_e1rm.empty else "-")
+                with col2:
+                    st.metric("1RM Massimo", f"{valid_e1rm.max():.1f} kg" if not valid_e1rm.empty else "-")
+                with col3:
+                    st.metric("Volume Ultima Settimana", f"{load_weeks['volume'].iloc[-1]:.0f} kg")
+                
+                # Cicli di 6 settimane dalla data di inizio scheda
+                cycles = training_load.exercise_cycles(selected_exercise, st.session_state.data_inizio_scheda)
+                st.dataframe(pd.DataFrame({
+                    "Ciclo": cycles['ciclo'],
+                    "Dal": cycles['dal'].dt.strftime("%Y-%m-%d"),
+                    "Settimane": cycles['settimane'],
+                    "Volume (kg)": cycles['volume'].round(0),
+                    "Ripetizioni": cycles['ripetizioni'].astype(int),
+                    "1RM Stimato (kg)": cycles['e1rm'].round(1)
+                }), use_container_width=True, hide_index=True)
+            else:
+                st.info("Nessun carico registrato (servono peso e ripetizioni)")
             
-            st.plotly_chart(fig_comp, use_container_width=True)
+            with st.expander("📦 Tonnellaggio per giorno e ciclo"):
+                tonnage = training_load.day_tonnage(st.session_state.data_inizio_scheda)
+                st.dataframe(tonnage.round(0), use_container_width=True)
             
             st.subheader("📋 Dettagli Allenamenti")
-            detail_data = []
-            for h in history:
-                detail_data.append({
-                    "Data": h['data'],
-                    "Settimana": h.get('settimana', 1),
-                    "Giorno": h['giorno'],
-                    "Target": f"{h['serie_target']}x{h['rip_target']}",
-                    "Eseguito": f"{h['serie_eseguite']}x{h['rip_eseguite']}",
-                    "Peso": h['peso'],
-                    "Recupero": h['recupero'],
-                    "✅": "Sì" if h['completato'] else "No"
-                })
-            
-            df = pd.DataFrame(detail_data)
+            df = pd.DataFrame({
+                "Data": dates.dt.strftime("%Y-%m-%d"),
+                "Settimana": weeks,
+                "Giorno": history['giorno'],
+                "Target": history['serie_target'] + "x" + history['rip_target'],
+                "Eseguito": history['serie_eseguite'] + "x" + history['rip_eseguite'],
+                "Peso": history['peso'],
+                "Recupero": history['recupero'],
+                "✅": history['completato'].map({True: "Sì", False: "No"})
+            })
             st.dataframe(df, use_container_width=True, hide_index=True)
 
     # --- PESO E CALORIE ---
 elif menu == "⚖️ Peso e Calorie":
+    from charts import build_body_weight_figure, build_calories_figure
+    
     st.title("⚖️ Storico Peso e Calorie")
     
     st.markdown("### 📝 Inserisci Nuovo Dato")
@@ -849,7 +1531,7 @@ elif menu == "⚖️ Peso e Calorie":
             entry_date = st.date_input("Data", value=date.today())
         
         with col2:
-            peso = st.text_input("Peso (kg)")
+            peso = st.text_input("Peso (kg)", placeholder="74,5")
         
         with col3:
             calorie = st.number_input("Calorie", min_value=0, max_value=10000, step=50)
@@ -859,21 +1541,16 @@ elif menu == "⚖️ Peso e Calorie":
         if submitted:
             date_str = entry_date.strftime("%Y-%m-%d")
             
-            # Rimuovi eventuale dato già esistente per questa data
-            st.session_state.weight_calories_history = [
-                e for e in st.session_state.weight_calories_history 
-                if e['data'] != date_str
-            ]
-            
-            # Aggiungi nuovo dato
-            new_entry = {
-                'data': date_str,
-                'peso': peso.strip() if peso.strip() else '',
-                'calorie': str(calorie) if calorie > 0 else ''
-            }
-            st.session_state.weight_calories_history.append(new_entry)
+            # Nuovo dato (sostituisce quello eventualmente già presente per questa data)
+            new_entry = WeightEntry(
+                data=date_str,
+                peso=peso.strip() if peso.strip() else '',
+                calorie=str(calorie) if calorie > 0 else '',
+                peso_kg=parse_kg(peso)
+            )
+            mutate('weight_calories_history', 'put_weight', new_entry)
             
-            save_all_data()
+            queue_save_all_data()
             st.success("✅ Dati salvati!")
             st.rerun()
     
@@ -882,71 +1559,28 @@ elif menu == "⚖️ Peso e Calorie":
     if not st.session_state.weight_calories_history:
         st.info("Nessun dato registrato. Inserisci peso e calorie per iniziare!")
     else:
-        # Ordina per data
-        history = sorted(st.session_state.weight_calories_history, key=lambda x: x['data'])
-        
-        # Prepara dati per i grafici
-        dates = [h['data'] for h in history]
-        weights = []
-        calories = []
-        
-        for h in history:
-            try:
-                if h['peso']:
-                    # Rimuovi eventuali caratteri non numerici tranne punto e virgola
-                    peso_str = h['peso'].replace(',', '.').strip()
-                    weights.append(float(peso_str))
-                else:
-                    weights.append(None)
-            except:
-                weights.append(None)
-            
-            try:
-                calories.append(int(h['calorie']) if h['calorie'] else None)
-            except:
-                calories.append(None)
+        # Tabella ordinata per data con peso e calorie già numerici
+        wc_frame = get_weight_calories_frame()
         
         # Grafico Peso
         st.subheader("📊 Andamento Peso")
-        fig_weight = go.Figure()
-        
-        valid_weights = [(d, w) for d, w in zip(dates, weights) if w is not None]
-        if valid_weights:
-            valid_dates_w, valid_weight_values = zip(*valid_weights)
-            
-            # Dividi per 100 solo per la visualizzazione
-            valid_weight_values_display = [w / 100 for w in valid_weight_values]
-            
-            fig_weight.add_trace(go.Scatter(
-                x=valid_dates_w,
-                y=valid_weight_values_display,
-                mode='lines+markers',
-                name='Peso',
-                line=dict(color='#3498db', width=3),
-                marker=dict(size=10),
-                hovertemplate='<b>%{x}</b><br>Peso: %{y:.1f} kg<extra></extra>'
-            ))
-            
-            fig_weight.update_layout(
-                xaxis_title="Data",
-                yaxis_title="Peso (kg)",
-                hovermode='x unified',
-                template='plotly_white',
-                height=400
-            )
+        valid_weights = wc_frame[wc_frame['peso_kg'].notna()]
+        if not valid_weights.empty:
+            valid_weight_values = valid_weights['peso_kg'].to_numpy()
             
+            fig_weight = get_figure('peso', None, wc_frame, build_body_weight_figure)
             st.plotly_chart(fig_weight, use_container_width=True)
             
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("Peso Iniziale", f"{valid_weight_values[0] / 100:.1f} kg")
+                st.metric("Peso Iniziale", f"{valid_weight_values[0]:.1f} kg")
             with col2:
-                st.metric("Peso Attuale", f"{valid_weight_values[-1] / 100:.1f} kg")
+                st.metric("Peso Attuale", f"{valid_weight_values[-1]:.1f} kg")
             with col3:
-                diff = (valid_weight_values[-1] - valid_weight_values[0]) / 100
+                diff = valid_weight_values[-1] - valid_weight_values[0]
                 st.metric("Variazione", f"{diff:+.1f} kg")
             with col4:
-                avg = sum(valid_weight_values) / len(valid_weight_values) / 100
+                avg = valid_weight_values.mean()
                 st.metric("Media", f"{avg:.1f} kg")
         else:
             st.info("Nessun dato di peso registrato")
@@ -955,42 +1589,21 @@ elif menu == "⚖️ Peso e Calorie":
         
         # Grafico Calorie
         st.subheader("🍽️ Andamento Calorie")
-        fig_calories = go.Figure()
-        
-        valid_calories = [(d, c) for d, c in zip(dates, calories) if c is not None]
-        if valid_calories:
-            valid_dates_c, valid_calorie_values = zip(*valid_calories)
-            
-            fig_calories.add_trace(go.Scatter(
-                x=valid_dates_c,
-                y=valid_calorie_values,
-                mode='lines+markers',
-                name='Calorie',
-                line=dict(color='#e74c3c', width=3),
-                marker=dict(size=10),
-                fill='tozeroy',
-                fillcolor='rgba(231, 76, 60, 0.2)',
-                hovertemplate='<b>%{x}</b><br>Calorie: %{y}<extra></extra>'
-            ))
-            
-            fig_calories.update_layout(
-                xaxis_title="Data",
-                yaxis_title="Calorie",
-                hovermode='x unified',
-                template='plotly_white',
-                height=400
-            )
+        valid_calories = wc_frame[wc_frame['calorie_num'].notna()]
+        if not valid_calories.empty:
+            valid_calorie_values = valid_calories['calorie_num'].to_numpy()
             
+            fig_calories = get_figure('calorie', None, wc_frame, build_calories_figure)
             st.plotly_chart(fig_calories, use_container_width=True)
             
             col1, col2, col3 = st.columns(3)
             with col1:
-                avg_cal = sum(valid_calorie_values) / len(valid_calorie_values)
+                avg_cal = valid_calorie_values.mean()
                 st.metric("Media Calorie", f"{avg_cal:.0f}")
             with col2:
-                st.metric("Minimo", f"{min(valid_calorie_values)}")
+                st.metric("Minimo", f"{valid_calorie_values.min():g}")
             with col3:
-                st.metric("Massimo", f"{max(valid_calorie_values)}")
+                st.metric("Massimo", f"{valid_calorie_values.max():g}")
         else:
             st.info("Nessun dato di calorie registrato")
         
@@ -1000,32 +1613,23 @@ elif menu == "⚖️ Peso e Calorie":
 
         # Tabella dettagli
         st.subheader("📋 Dettagli")
-        detail_data = []
-        for h in reversed(history):  # Mostra dal più recente
-            # Dividi il peso per 100 anche nella tabella
-            if h['peso']:
-                try:
-                    peso_display = f"{float(h['peso']) / 100:.1f}"
-                except:
-                    peso_display = h['peso']
-            else:
-                peso_display = '-'
-            
-            detail_data.append({
-                "Data": h['data'],
-                "Peso (kg)": peso_display,
-                "Calorie": h['calorie'] if h['calorie'] else '-'
-            })
-        
-        df = pd.DataFrame(detail_data)
+        details = wc_frame.iloc[::-1]  # Mostra dal più recente
+        peso_display = details['peso'].where(
+            details['peso_kg'].isna(), details['peso_kg'].map('{:.1f}'.format)
+        )
+        df = pd.DataFrame({
+            "Data": details['data'],
+            "Peso (kg)": peso_display.replace('', '-'),
+            "Calorie": details['calorie'].replace('', '-')
+        })
         st.dataframe(df, use_container_width=True, hide_index=True)
         
         # Pulsante per eliminare tutti i dati
         st.markdown("---")
         if st.button("🗑️ Elimina Tutti i Dati Peso/Calorie", type="secondary"):
             if st.session_state.get('confirm_delete_wc', False):
-                st.session_state.weight_calories_history = []
-                save_all_data()
+                mutate('weight_calories_history', 'set', [])
+                queue_save_all_data()
                 st.session_state.confirm_delete_wc = False
                 st.success("✅ Tutti i dati sono stati eliminati!")
                 st.rerun()
@@ -1034,5 +1638,29 @@ elif menu == "⚖️ Peso e Calorie":
                 st.warning("⚠️ Clicca di nuovo per confermare l'eliminazione")
                 st.rerun()
 
+RECORDER.record(f"pagina {menu}", time.perf_counter() - page_start)
+RECORDER.record("rerun", time.perf_counter() - rerun_start)
+
+# Pannello prestazioni (opzionale)
+st.sidebar.markdown("---")
+if st.sidebar.toggle("⏱️ Performance", key='show_performance'):
+    performance = RECORDER.summary()
+    if not performance:
+        st.sidebar.caption("Nessuna misura disponibile")
+    else:
+        st.sidebar.dataframe(pd.DataFrame(performance), use_container_width=True, hide_index=True)
+        selected_span = st.sidebar.selectbox("Istogramma", [row['span'] for row in performance], key='performance_span')
+        from charts import build_histogram_figure
+        st.sidebar.plotly_chart(build_histogram_figure(RECORDER.histogram(selected_span)), use_container_width=True)
+        st.sidebar.download_button(
+            "📥 Esporta JSON",
+            RECORDER.to_json(),
+            file_name="performance.json",
+            mime="application/json"
+        )
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("💪 **Workout Tracker v3.0**")
+
+# Ultimo passo: la pagina è già visibile con i dati dello snapshot
+finish_revalidation()
@@ -0,0 +1,170 @@
+"""Sostituto in memoria di gspread per i benchmark.
+
+Implementa la parte dell'API di gspread usata dall'app (spreadsheet,
+worksheet, letture e scritture batch) su liste di righe in memoria. Ogni
+chiamata viene contata e può simulare la latenza di rete con una pausa.
+"""
+import re
+import time
+from collections import Counter
+
+import gspread
+import requests
+
+
+def _column_number(letters):
+    number = 0
+    for char in letters:
+        number = number * 26 + ord(char) - 64
+    return number
+
+
+def _parse_a1(a1):
+    """(riga, colonna, riga finale, colonna finale) di un intervallo A1"""
+    match = re.match(r"([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$", a1)
+    col1, row1, col2, row2 = match.groups()
+    return (
+        int(row1 or 1), _column_number(col1),
+        int(row2) if row2 else None, _column_number(col2) if col2 else None
+    )
+
+
+def _api_error(message):
+    response = requests.Response()
+    response.status_code = 400
+    response._content = (
+        '{"error": {"code": 400, "message": "%s", "status": "INVALID_ARGUMENT"}}' % message
+    ).encode('utf-8')
+    return gspread.exceptions.APIError(response)
+
+
+class FakeClient:
+    """Client gspread finto: un solo spreadsheet, latenza e conteggio delle chiamate"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.spreadsheet = FakeSpreadsheet(self)
+
+    def call(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def open_by_key(self, key):
+        self.call('open')
+        return self.spreadsheet
+
+    open_by_url = open_by_key
+    open = open_by_key
+
+
+class FakeSpreadsheet:
+    def __init__(self, client):
+        self.client = client
+        self.sheets = {}
+
+    def _sheet(self, name):
+        if name not in self.sheets:
+            raise _api_error(f"Unable to parse range: {name}")
+        return self.sheets[name]
+
+    def set_rows(self, name, rows):
+        """Imposta il contenuto di un worksheet senza contare chiamate"""
+        self.sheets.setdefault(name, FakeWorksheet(self.client, name)).rows = [list(r) for r in rows]
+
+    def worksheet(self, name):
+        self.client.call('worksheet')
+        if name not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(name)
+        return self.sheets[name]
+
+    def add_worksheet(self, title, rows, cols):
+        self.client.call('add_worksheet')
+        self.sheets[title] = FakeWorksheet(self.client, title)
+        return self.sheets[title]
+
+    def values_get(self, range_name, params=None):
+        self.client.call('values_get')
+        name = range_name.split('!')[0].strip("'")
+        return {'range': range_name, 'values': [list(r) for r in self._sheet(name).rows]}
+
+    def values_batch_get(self, ranges, params=None):
+        self.client.call('values_batch_get')
+        columns = (params or {}).get('majorDimension') == 'COLUMNS'
+        value_ranges = []
+        for range_name in ranges:
+            name, _, a1 = range_name.partition('!')
+            rows = self._sheet(name.strip("'")).rows
+            if columns:
+                first_row, column, _, _ = _parse_a1(a1)
+                values = [row[column - 1] if len(row) >= column else '' for row in rows[first_row - 1:]]
+                while values and values[-1] == '':
+                    values.pop()
+                value_ranges.append({'range': range_name, 'values': [values] if values else []})
+            else:
+                value_ranges.append({'range': range_name, 'values': [list(r) for r in rows]})
+        return {'valueRanges': value_ranges}
+
+
+class FakeWorksheet:
+    def __init__(self, client, title):
+        self.client = client
+        self.title = title
+        self.rows = []
+
+    def _set(self, a1, values):
+        row, column, _, _ = _parse_a1(a1)
+        for i, values_row in enumerate(values):
+            while len(self.rows) < row + i:
+                self.rows.append([])
+            target = self.rows[row + i - 1]
+            while len(target) < column - 1 + len(values_row):
+                target.append('')
+            target[column - 1:column - 1 + len(values_row)] = values_row
+
+    def row_values(self, index):
+        self.client.call('row_values')
+        return list(self.rows[index - 1]) if index <= len(self.rows) else []
+
+    def get_values(self, *args, **kwargs):
+        self.client.call('get_values')
+        return [list(r) for r in self.rows]
+
+    def get_all_records(self, **kwargs):
+        self.client.call('get_all_records')
+        if not self.rows:
+            return []
+        header = self.rows[0]
+        return [
+            dict(zip(header, list(row) + [''] * (len(header) - len(row))))
+            for row in self.rows[1:]
+        ]
+
+    def update(self, range_name, values=None, **kwargs):
+        self.client.call('update')
+        self._set(range_name, values)
+
+    def batch_update(self, data, **kwargs):
+        self.client.call('batch_update')
+        for update in data:
+            self._set(update['range'], update['values'])
+
+    def delete_rows(self, start, end=None):
+        self.client.call('delete_rows')
+        del self.rows[start - 1:(end or start)]
+
+    def append_rows(self, rows, **kwargs):
+        self.client.call('append_rows')
+        self.rows.extend(list(r) for r in rows)
+
+    def append_row(self, row, **kwargs):
+        self.client.call('append_row')
+        self.rows.append(list(row))
+
+
+def install(client):
+    """Fa restituire client a gspread.authorize (credenziali incluse)"""
+    from google.oauth2 import service_account
+    service_account.Credentials.from_service_account_info = classmethod(lambda cls, *a, **k: object())
+    gspread.authorize = lambda *args, **kwargs: client
@@ -0,0 +1,191 @@
+"""Benchmark del Workout Tracker su storici sintetici.
+
+Esegue l'app con streamlit.testing (AppTest) su un gspread finto con latenza
+simulata e, per ogni dimensione dello storico, misura caricamento,
+salvataggio, preparazione di ogni pagina e ricerche per esercizio. Il report
+JSON contiene tempi, chiamate a Google Sheets e statistiche degli span.
+
+Uso:
+    python benchmarks/run_benchmarks.py --sizes 100 1000 10000 --latency 0.05
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import fake_gspread  # noqa: E402
+import synthetic  # noqa: E402
+from history import HistoryRepository, TrainingLoad, build_history_frame  # noqa: E402
+from models import history_from_json  # noqa: E402
+from perf import RECORDER  # noqa: E402
+
+APP_PATH = os.path.join(REPO_DIR, 'WorkoutTracker.py')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def per_call_us(func, args_list, repeat):
+    """Tempo medio (µs) di una chiamata di func su ogni elemento di args_list"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for args in args_list:
+            func(*args)
+    return (time.perf_counter() - start) / (repeat * len(args_list)) * 1e6
+
+
+def bench_lookups(history, exercise_names, repeat):
+    """Indici dello storico: costruzione e ricerche usate da get_exercise_history,
+    get_last_weight_for_exercise e dalla sezione carichi di Progressione"""
+    start = time.perf_counter()
+    repository = HistoryRepository(history)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    build_history_frame(history)
+    frame_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    training_load = TrainingLoad(history)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    # Aggiornamento incrementale: l'ultima sessione tolta e riaggiunta
+    start = time.perf_counter()
+    training_load.remove_session(history[-1])
+    training_load.add_session(history[-1])
+    load_update_ms = (time.perf_counter() - start) * 1000
+
+    args = [(name,) for name in exercise_names]
+    return {
+        'history_repository_build_ms': round(build_ms, 2),
+        'history_frame_build_ms': round(frame_ms, 2),
+        'training_load_build_ms': round(load_ms, 2),
+        'training_load_update_ms': round(load_update_ms, 2),
+        'get_exercise_history_us': round(per_call_us(repository.exercises.get, args, repeat), 2),
+        'get_last_weight_for_exercise_us': round(per_call_us(repository.exercises.last_weight, args, repeat), 2),
+        'training_load_exercise_weeks_us': round(per_call_us(training_load.exercise_weeks, args, repeat), 2),
+    }
+
+
+class AppRun:
+    """Sessione dell'app su cui misurare i singoli passi"""
+
+    def __init__(self, client, timeout):
+        self.client = client
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.at.secrets['gcp_service_account'] = {}
+        self.at.secrets['spreadsheet_id'] = 'benchmark'
+        # Salvataggi sincroni e niente file locali: si misura il percorso completo
+        self.at.secrets['write_behind'] = False
+        self.at.secrets['journal_path'] = ''
+        self.at.secrets['snapshot_path'] = ''
+        self.steps = {}
+
+    def step(self, name, action):
+        calls_before = sum(self.client.calls.values())
+        start = time.perf_counter()
+        action()
+        wall_ms = (time.perf_counter() - start) * 1000
+        if self.at.exception:
+            raise RuntimeError(f"{name}: {self.at.exception[0].message}")
+        self.steps[name] = {
+            'wall_ms': round(wall_ms, 2),
+            'sheets_calls': sum(self.client.calls.values()) - calls_before,
+        }
+
+    def menu(self, label):
+        return lambda: self.at.sidebar.radio[0].set_value(label).run()
+
+
+def bench_size(sessions, latency, timeout, repeat):
+    template = synthetic.make_template()
+    history = synthetic.make_history(template, sessions)
+    weight_calories = synthetic.make_weight_calories(sessions)
+
+    client = fake_gspread.FakeClient(latency)
+    fake_gspread.install(client)
+    synthetic.seed_spreadsheet(client.spreadsheet, template, history, weight_calories)
+
+    st.cache_resource.clear()
+    RECORDER.clear()
+
+    run = AppRun(client, timeout)
+    at = run.at
+    exercise = template[synthetic.GIORNI[0]][0]['nome']
+
+    run.step('load_all_data', at.run)
+    run.step('pagina Registra Allenamento', run.menu("✍️ Registra Allenamento"))
+    submit = [b for b in at.button if b.label == "💾 Salva Esercizio"][0]
+    run.step('save_all_data', lambda: submit.click().run())
+    run.step('pagina Storico', run.menu("📅 Storico"))
+    run.step('pagina Progressione', run.menu("📈 Progressione"))
+    run.step('pagina Progressione (esercizio)', lambda: at.selectbox[0].set_value(exercise).run())
+    run.step('pagina Peso e Calorie', run.menu("⚖️ Peso e Calorie"))
+    run.step('rerun senza modifiche', at.run)
+
+    names = sorted({ex['nome'] for exercises in template.values() for ex in exercises})
+    return {
+        'sessions': sessions,
+        'exercise_rows': sum(len(s['esercizi']) for s in history),
+        'weight_entries': len(weight_calories),
+        'steps': run.steps,
+        'sheets_calls': dict(client.calls),
+        'spans': RECORDER.summary(),
+        'lookups': bench_lookups(history_from_json(history), names, repeat),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help="numero di sessioni degli storici sintetici")
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="latenza simulata di ogni chiamata a Google Sheets (secondi)")
+    parser.add_argument('--repeat', type=int, default=200,
+                        help="ripetizioni delle ricerche per esercizio")
+    parser.add_argument('--timeout', type=float, default=600,
+                        help="timeout di ogni rerun dell'app (secondi)")
+    parser.add_argument('--output', default='benchmark_report.json',
+                        help="file del report JSON")
+    args = parser.parse_args(argv)
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'latency_s': args.latency,
+        'results': [],
+    }
+    for sessions in args.sizes:
+        print(f"Benchmark con {sessions} sessioni...", file=sys.stderr)
+        result = bench_size(sessions, args.latency, args.timeout, args.repeat)
+        report['results'].append(result)
+        for name, step in result['steps'].items():
+            print(f"  {name:<35} {step['wall_ms']:>10.1f} ms  {step['sheets_calls']:>3} chiamate", file=sys.stderr)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Report scritto in {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Dati sintetici per i benchmark: scheda, storico pluriennale, peso e calorie."""
+import json
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from core import HISTORY_HEADER  # noqa: E402
+
+GIORNI = ["Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato"]
+
+ESERCIZI = [
+    "Squat", "Panca Piana", "Stacco", "Military Press", "Trazioni", "Rematore",
+    "Affondi", "Dip", "Curl", "French Press", "Leg Press", "Calf Raise",
+    "Croci", "Lat Machine", "Hip Thrust", "Alzate Laterali", "Plank", "Face Pull",
+]
+
+
+def make_template(exercises_per_day=5, seed=0):
+    """Scheda settimanale: exercises_per_day esercizi per giorno"""
+    rng = random.Random(seed)
+    template = {}
+    for day in GIORNI:
+        template[day] = [
+            {
+                'nome': name,
+                'serie_settimane': [str(rng.randint(3, 5))] * 6,
+                'ripetizioni_settimane': [str(rng.choice([5, 8, 10, 12]))] * 6,
+                'recupero': rng.choice(["90s", "2m", "3m"]),
+                'note': ''
+            }
+            for name in rng.sample(ESERCIZI, exercises_per_day)
+        ]
+    return template
+
+
+def make_history(template, sessions, start=date(2015, 1, 5), seed=0):
+    """Storico di sessions sessioni, una al giorno a partire da start"""
+    rng = random.Random(seed)
+    history = []
+    for i in range(sessions):
+        session_date = start + timedelta(days=i)
+        day = GIORNI[i % len(GIORNI)]
+        week = (i // 7) % 6 + 1
+        exercises = []
+        for ex in template[day]:
+            sets = ex['serie_settimane'][week - 1]
+            reps = ex['ripetizioni_settimane'][week - 1]
+            exercises.append({
+                'nome': ex['nome'],
+                'serie_target': sets,
+                'rip_target': reps,
+                'recupero': ex['recupero'],
+                'peso': f"{20 + i // 20 + rng.randint(0, 5)}",
+                'serie_eseguite': sets,
+                'rip_eseguite': ",".join([reps] * int(sets)),
+                'completato': rng.random() < 0.8
+            })
+        history.append({
+            'data': session_date.strftime("%Y-%m-%d"),
+            'giorno': day,
+            'settimana': week,
+            'esercizi': exercises
+        })
+    return history
+
+
+def make_weight_calories(days, start=date(2015, 1, 5), seed=0):
+    """Una misura di peso e calorie al giorno (peso in kg)"""
+    rng = random.Random(seed)
+    return [
+        {
+            'data': (start + timedelta(days=i)).strftime("%Y-%m-%d"),
+            'peso': f"{80 + rng.randint(-30, 30) / 10:.1f}",
+            'calorie': str(rng.randrange(1800, 3200, 50)) if rng.random() < 0.9 else ''
+        }
+        for i in range(days)
+    ]
+
+
+def history_rows(history):
+    """Righe del worksheet HistoryRows (header incluso)"""
+    rows = [HISTORY_HEADER]
+    for session in history:
+        base = [session['data'], session['giorno'], session['settimana']]
+        for position, ex in enumerate(session['esercizi']):
+            rows.append(base + [
+                ex['nome'], position, ex['peso'], int(ex['serie_target']),
+                int(ex['rip_target']), int(ex['serie_eseguite']), ex['rip_eseguite'],
+                ex['recupero'], ex['completato'], float(ex['peso'])
+            ])
+    return rows
+
+
+def seed_spreadsheet(spreadsheet, template, history, weight_calories, start_date="2015-01-05"):
+    """Riempie lo spreadsheet finto con i worksheet dell'app"""
+    spreadsheet.set_rows('Template', [['Giorno', 'Esercizio_JSON']] + [
+        [day, json.dumps(exercises, ensure_ascii=False)] for day, exercises in template.items()
+    ])
+    spreadsheet.set_rows('HistoryRows', history_rows(history))
+    spreadsheet.set_rows('Config', [['Chiave', 'Valore'], ['data_inizio_scheda', start_date]])
+    spreadsheet.set_rows('WeightCalories', [['Data', 'Peso', 'Calorie', 'Peso_Kg']] + [
+        [e['data'], e['peso'], int(e['calorie']) if e['calorie'] else '', float(e['peso'])]
+        for e in weight_calories
+    ])
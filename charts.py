@@ -0,0 +1,220 @@
+"""Grafici Plotly dell'app: Progressione, Peso e Calorie e pannello prestazioni.
+
+Le figure vengono costruite a partire dalle tabelle colonnari dello storico
+e conservate in una cache condivisa, indicizzata dal contenuto dei dati:
+finché i dati non cambiano un rerun riusa la figura già costruita.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.graph_objects as go
+
+
+def frame_content_hash(frame):
+    """Hash del contenuto di una tabella (nomi delle colonne e valori)"""
+    digest = hashlib.sha1(','.join(map(str, frame.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class FigureCache:
+    """Cache LRU delle figure costruite, condivisa tra rerun e sessioni.
+
+    Le figure restituite sono condivise: vanno solo visualizzate, mai modificate.
+    """
+
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        """Figura associata a key; se assente la costruisce con build()"""
+        with self._lock:
+            figure = self._figures.get(key)
+            if figure is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return figure
+            self.misses += 1
+
+        figure = build()
+
+        with self._lock:
+            self._figures[key] = figure
+            self._figures.move_to_end(key)
+            # Elimina le figure usate meno di recente oltre il limite
+            while len(self._figures) > self.max_size:
+                self._figures.popitem(last=False)
+        return figure
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+
+
+def build_exercise_weight_figure(history):
+    """Progressione del peso di un esercizio, punti colorati per settimana"""
+    valid = history[history['peso_kg'].notna()]
+    valid_weeks = valid['settimana']
+
+    # Colora i punti in base alla settimana
+    colors = (
+        "rgb(" + (40 + valid_weeks * 30).astype(str)
+        + ", " + (100 + valid_weeks * 20).astype(str)
+        + ", " + (200 - valid_weeks * 20).astype(str) + ")"
+    )
+
+    fig_weight = go.Figure()
+    fig_weight.add_trace(go.Scatter(
+        x=valid['data'],
+        y=valid['peso_kg'],
+        mode='lines+markers',
+        name='Peso',
+        line=dict(color='#1f77b4', width=3),
+        marker=dict(size=10, color=colors),
+        text="Settimana " + valid_weeks.astype(str),
+        hovertemplate='<b>%{x}</b><br>Peso: %{y:.1f} kg<br>%{text}<extra></extra>'
+    ))
+
+    fig_weight.update_layout(
+        xaxis_title="Data",
+        yaxis_title="Peso (kg)",
+        hovermode='x unified',
+        template='plotly_white',
+        height=400
+    )
+    return fig_weight
+
+
+def build_completion_figure(history):
+    """Completamento degli allenamenti di un esercizio"""
+    completions = history['completato'].astype(int)
+
+    fig_comp = go.Figure()
+    fig_comp.add_trace(go.Bar(
+        x=history['data'],
+        y=completions,
+        marker_color=completions.map({1: '#2ecc71', 0: '#e74c3c'}),
+        name='Completato',
+        text="S" + history['settimana'].astype(str),
+        textposition='outside'
+    ))
+
+    fig_comp.update_layout(
+        xaxis_title="Data",
+        yaxis_title="Completato",
+        yaxis=dict(tickmode='linear', tick0=0, dtick=1),
+        template='plotly_white',
+        height=300,
+        showlegend=False
+    )
+    return fig_comp
+
+
+def build_training_load_figure(weeks):
+    """Volume settimanale di un esercizio (barre) e 1RM stimato (linea, secondo asse)"""
+    fig_load = go.Figure()
+    fig_load.add_trace(go.Bar(
+        x=weeks['inizio_settimana'].to_numpy(),
+        y=weeks['volume'].to_numpy(),
+        name='Volume',
+        marker_color='#1f77b4',
+        opacity=0.6,
+        hovertemplate='<b>%{x}</b><br>Volume: %{y:.0f} kg<extra></extra>'
+    ))
+    fig_load.add_trace(go.Scatter(
+        x=weeks['inizio_settimana'].to_numpy(),
+        y=weeks['e1rm'].to_numpy(),
+        name='1RM stimato',
+        mode='lines+markers',
+        line=dict(color='#e67e22', width=3),
+        yaxis='y2',
+        connectgaps=True,
+        hovertemplate='<b>%{x}</b><br>1RM stimato: %{y:.1f} kg<extra></extra>'
+    ))
+
+    fig_load.update_layout(
+        xaxis_title="Settimana",
+        yaxis=dict(title="Volume (kg)"),
+        yaxis2=dict(title="1RM stimato (kg)", overlaying='y', side='right'),
+        hovermode='x unified',
+        template='plotly_white',
+        height=400,
+        legend=dict(orientation='h', y=1.1)
+    )
+    return fig_load
+
+
+def build_body_weight_figure(entries):
+    """Andamento del peso corporeo"""
+    valid = entries[entries['peso_kg'].notna()]
+
+    fig_weight = go.Figure()
+    fig_weight.add_trace(go.Scatter(
+        x=valid['data'].to_numpy(),
+        y=valid['peso_kg'].to_numpy(),
+        mode='lines+markers',
+        name='Peso',
+        line=dict(color='#3498db', width=3),
+        marker=dict(size=10),
+        hovertemplate='<b>%{x}</b><br>Peso: %{y:.1f} kg<extra></extra>'
+    ))
+
+    fig_weight.update_layout(
+        xaxis_title="Data",
+        yaxis_title="Peso (kg)",
+        hovermode='x unified',
+        template='plotly_white',
+        height=400
+    )
+    return fig_weight
+
+
+def build_calories_figure(entries):
+    """Andamento delle calorie"""
+    valid = entries[entries['calorie_num'].notna()]
+
+    fig_calories = go.Figure()
+    fig_calories.add_trace(go.Scatter(
+        x=valid['data'].to_numpy(),
+        y=valid['calorie_num'].to_numpy(),
+        mode='lines+markers',
+        name='Calorie',
+        line=dict(color='#e74c3c', width=3),
+        marker=dict(size=10),
+        fill='tozeroy',
+        fillcolor='rgba(231, 76, 60, 0.2)',
+        hovertemplate='<b>%{x}</b><br>Calorie: %{y}<extra></extra>'
+    ))
+
+    fig_calories.update_layout(
+        xaxis_title="Data",
+        yaxis_title="Calorie",
+        hovermode='x unified',
+        template='plotly_white',
+        height=400
+    )
+    return fig_calories
+
+
+def build_histogram_figure(histogram):
+    """Istogramma delle durate di uno span (lista di (classe, conteggio))"""
+    labels = [label for label, _ in histogram]
+    counts = [count for _, count in histogram]
+
+    fig_hist = go.Figure()
+    fig_hist.add_trace(go.Bar(x=labels, y=counts, marker_color='#9b59b6'))
+    fig_hist.update_layout(
+        xaxis_title="Durata",
+        yaxis_title="Conteggio",
+        template='plotly_white',
+        height=250,
+        margin=dict(l=10, r=10, t=10, b=10),
+        showlegend=False
+    )
+    return fig_hist
@@ -0,0 +1,394 @@
+"""Logica dei dati del Workout Tracker, indipendente da Streamlit.
+
+Intestazioni dei worksheet, conversione tra righe dei fogli e strutture
+dell'app, sincronizzazione delta dello storico, calcolo della settimana e
+hash delle collezioni: tutto importabile anche fuori dall'app.
+"""
+import hashlib
+import json
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from models import ExerciseRecord, Session, WeightEntry, to_hash_values
+from perf import timed
+from units import format_kg, parse_kg
+
+# Giorni della settimana
+GIORNI = ["Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato", "Domenica"]
+
+# Intestazioni dei worksheet
+TEMPLATE_HEADER = ['Giorno', 'Esercizio_JSON']
+# Storico normalizzato: una riga per esercizio di ogni sessione
+# (Peso come inserito, Peso_Kg in kg)
+HISTORY_HEADER = [
+    'Data', 'Giorno', 'Settimana', 'Esercizio', 'Ordine', 'Peso',
+    'Serie_Target', 'Rip_Target', 'Serie_Eseguite', 'Rip_Eseguite', 'Recupero', 'Completato',
+    'Peso_Kg'
+]
+CONFIG_HEADER = ['Chiave', 'Valore']
+WEIGHT_CALORIES_HEADER = ['Data', 'Peso', 'Calorie', 'Peso_Kg']
+
+# Colonna dei chili canonici: i fogli che non ce l'hanno vanno migrati
+KG_COLUMN = 'Peso_Kg'
+
+# Vecchio formato dello storico (una riga per sessione con gli esercizi in JSON)
+LEGACY_HISTORY_SHEET = 'History'
+LEGACY_HISTORY_HEADER = ['Data', 'Giorno', 'Settimana', 'Esercizi_JSON']
+
+SHEET_HEADERS = {
+    'Template': TEMPLATE_HEADER,
+    'HistoryRows': HISTORY_HEADER,
+    'Config': CONFIG_HEADER,
+    'WeightCalories': WEIGHT_CALORIES_HEADER,
+}
+
+# Worksheet letti senza numericise: il peso resta il testo inserito ("74,5")
+RAW_RECORD_SHEETS = ('HistoryRows', 'WeightCalories')
+
+
+# --- WORKSHEET: LETTURA DEI RECORD ---
+@timed()
+def parse_template_records(records):
+    """Costruisce il template a partire dai record del worksheet"""
+    template = {day: [] for day in GIORNI}
+    
+    for record in records:
+        day = record.get('Giorno')
+        exercises_json = record.get('Esercizio_JSON')
+        if day and exercises_json:
+            template[day] = json.loads(exercises_json)
+    
+    return template
+
+
+def parse_config_records(records):
+    """Estrae la data di inizio scheda dai record del worksheet (None se assente)"""
+    for record in records:
+        if record.get('Chiave') == 'data_inizio_scheda':
+            return str(record.get('Valore', ''))
+    return None
+
+
+@timed()
+def parse_weight_calories_records(records):
+    """Costruisce lo storico peso e calorie a partire dai record del worksheet.
+    
+    Nel vecchio formato (senza Peso_Kg) il peso era in centesimi di kg, con
+    le virgole scartate da gspread: i chili vengono ricavati da lì e il peso
+    da mostrare diventa quello in kg.
+    """
+    records = list(records)
+    frame = pd.DataFrame.from_records(records, columns=WEIGHT_CALORIES_HEADER)
+    
+    peso = frame['Peso'].fillna('').astype(str)
+    if records and KG_COLUMN not in records[0]:
+        peso_kg = pd.to_numeric(peso.str.replace(',', '').str.strip(), errors='coerce') / 100
+        peso_kg = peso_kg.where(np.isfinite(peso_kg))
+        peso = peso.where(peso_kg.isna(), peso_kg.map(format_kg))
+    else:
+        peso_kg = pd.to_numeric(frame[KG_COLUMN], errors='coerce')
+        peso_kg = peso_kg.where(np.isfinite(peso_kg))
+    
+    # Calorie intere quando sono numeri, altrimenti il valore del foglio così com'è
+    calorie = frame['Calorie'].fillna('').astype(str)
+    calorie_num = pd.to_numeric(calorie.str.strip(), errors='coerce')
+    calorie_num = calorie_num.where(np.isfinite(calorie_num))
+    calorie = calorie.where(calorie_num.isna(), calorie_num.fillna(0).astype('int64').astype(str))
+    
+    return [
+        WeightEntry(record.get('Data'), p, c, None if np.isnan(kg) else float(kg))
+        for record, p, c, kg in zip(records, peso, calorie, peso_kg)
+    ]
+
+
+def weight_calories_to_rows(entries):
+    """Righe del worksheet WeightCalories"""
+    return [
+        [entry.data, entry.peso, entry.calorie, '' if entry.peso_kg is None else entry.peso_kg]
+        for entry in entries
+    ]
+
+
+def needs_kg_migration(values):
+    """True se il worksheet (righe grezze, header incluso) non ha ancora la colonna Peso_Kg"""
+    return bool(values) and KG_COLUMN not in values[0]
+
+
+# --- STORICO: RIGHE DEL WORKSHEET HistoryRows ---
+def to_cell_int(value):
+    """Intero per il foglio se la stringa contiene solo cifre, altrimenti la stringa"""
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+
+def cell_to_text(value):
+    """Riporta il valore di una cella alla stringa usata nell'app"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def exercise_to_cells(exercise, position):
+    """Colonne tipizzate di un esercizio nel worksheet HistoryRows"""
+    return [
+        exercise.nome,
+        position,
+        exercise.peso,  # testo come inserito: il valore numerico è in Peso_Kg
+        to_cell_int(exercise.serie_target),
+        to_cell_int(exercise.rip_target),
+        to_cell_int(exercise.serie_eseguite),
+        to_cell_int(exercise.rip_eseguite),
+        exercise.recupero,
+        bool(exercise.completato),
+        '' if exercise.peso_kg is None else exercise.peso_kg
+    ]
+
+
+def record_to_exercise(record):
+    """Esercizio (valori stringa come nell'app) da un record di HistoryRows"""
+    completato = record.get('Completato')
+    peso_kg = parse_kg(record.get(KG_COLUMN))
+    if peso_kg is None:
+        # Righe scritte prima della colonna Peso_Kg
+        peso_kg = parse_kg(record.get('Peso'))
+    return ExerciseRecord(
+        nome=sys.intern(cell_to_text(record.get('Esercizio'))),
+        serie_target=cell_to_text(record.get('Serie_Target')),
+        rip_target=cell_to_text(record.get('Rip_Target')),
+        recupero=sys.intern(cell_to_text(record.get('Recupero'))),
+        peso=cell_to_text(record.get('Peso')),
+        serie_eseguite=cell_to_text(record.get('Serie_Eseguite')),
+        rip_eseguite=cell_to_text(record.get('Rip_Eseguite')),
+        completato=completato is True or str(completato).upper() == 'TRUE',
+        peso_kg=peso_kg
+    )
+
+
+def history_session_to_rows(session):
+    """Converte una sessione nelle righe del worksheet HistoryRows"""
+    base = [session.data, session.giorno, session.settimana]
+    if not session.esercizi:
+        # Sessione vuota: una riga senza esercizio la conserva
+        return [base + [''] * (len(HISTORY_HEADER) - len(base))]
+    
+    return [base + exercise_to_cells(ex, i) for i, ex in enumerate(session.esercizi)]
+
+
+def history_to_rows(history):
+    """Righe del worksheet HistoryRows per tutto lo storico"""
+    return [row for session in history for row in history_session_to_rows(session)]
+
+
+def history_records_to_rows(records):
+    """Righe canoniche nell'ordine del foglio (quelle vuote restano vuote).
+    
+    Sono confrontabili con history_to_rows per la sincronizzazione delta.
+    """
+    rows = []
+    for record in records:
+        if not record.get('Data'):
+            rows.append([''] * len(HISTORY_HEADER))
+            continue
+        
+        base = [
+            cell_to_text(record['Data']),
+            cell_to_text(record.get('Giorno')),
+            int(record.get('Settimana') or 1)
+        ]
+        if record.get('Esercizio') in ('', None):
+            rows.append(base + [''] * (len(HISTORY_HEADER) - len(base)))
+        else:
+            ordine = record.get('Ordine')
+            position = int(ordine) if ordine not in ('', None) else 0
+            cells = exercise_to_cells(record_to_exercise(record), position)
+            # Peso_Kg com'è nel foglio: le righe ancora da migrare risultano cambiate
+            kg_cell = record.get(KG_COLUMN)
+            cells[-1] = '' if kg_cell is None else kg_cell
+            rows.append(base + cells)
+    return rows
+
+
+def history_row_keys(rows):
+    """Chiavi (data, giorno, esercizio, occorrenza) delle righe dello storico"""
+    seen = {}
+    keys = []
+    for row in rows:
+        base = (row[0], row[1], row[3])
+        keys.append(base + (seen.get(base, 0),))
+        seen[base] = seen.get(base, 0) + 1
+    return keys
+
+
+def diff_history_rows(synced_rows, desired_rows):
+    """Confronta le righe dello storico con quelle già sincronizzate.
+    
+    Le righe invariate restano al loro posto, quelle modificate vengono
+    riscritte, le nuove occupano i posti liberati dalle eliminate (o vanno in
+    coda) e gli eventuali buchi residui vengono riempiti spostando le ultime
+    righe. Ritorna le righe finali e l'elenco degli indici (0-based) da scrivere.
+    """
+    desired = dict(zip(history_row_keys(desired_rows), desired_rows))
+    
+    rows = []
+    changed = set()
+    placed = set()
+    free = []
+    for i, (key, row) in enumerate(zip(history_row_keys(synced_rows), synced_rows)):
+        if key in desired and key not in placed:
+            placed.add(key)
+            rows.append(desired[key])
+            if desired[key] != row:
+                changed.add(i)
+        else:
+            rows.append(None)
+            free.append(i)
+    
+    for key, row in desired.items():
+        if key in placed:
+            continue
+        if free:
+            i = free.pop(0)
+            rows[i] = row
+        else:
+            i = len(rows)
+            rows.append(row)
+        changed.add(i)
+    
+    # Compatta: sposta le ultime righe nei buchi rimasti
+    while free:
+        while rows and rows[-1] is None:
+            last = len(rows) - 1
+            rows.pop()
+            if last in free:
+                free.remove(last)
+        if not free:
+            break
+        i = free.pop(0)
+        rows[i] = rows.pop()
+        changed.add(i)
+    
+    synced_len = len(synced_rows)
+    changed.update(range(len(rows), synced_len))
+    return rows, sorted(changed)
+
+
+def column_letter(index):
+    """Lettera della colonna (0-based) in notazione A1"""
+    return chr(ord('A') + index)
+
+
+def history_row_updates(rows, changed):
+    """Raggruppa le righe modificate in intervalli contigui per batch_update"""
+    width = len(HISTORY_HEADER)
+    last_col = column_letter(width - 1)
+    updates = []
+    
+    for i in changed:
+        values = rows[i] if i < len(rows) else [''] * width
+        sheet_row = i + 2  # riga 1 = header
+        if updates and updates[-1]['end'] == sheet_row - 1:
+            updates[-1]['end'] = sheet_row
+            updates[-1]['values'].append(values)
+        else:
+            updates.append({'start': sheet_row, 'end': sheet_row, 'values': [values]})
+    
+    return [
+        {'range': f"A{u['start']}:{last_col}{u['end']}", 'values': u['values']}
+        for u in updates
+    ]
+
+
+@timed()
+def parse_history_records(records):
+    """Ricostruisce le sessioni a partire dalle righe del worksheet HistoryRows"""
+    sessions = {}
+    positions = {}
+    
+    for record in records:
+        if not record.get('Data'):
+            continue
+        
+        key = (cell_to_text(record['Data']), cell_to_text(record.get('Giorno')))
+        session = sessions.get(key)
+        if session is None:
+            session = Session(key[0], sys.intern(key[1]), int(record.get('Settimana') or 1))
+            sessions[key] = session
+            positions[key] = []
+        
+        if record.get('Esercizio') in ('', None):
+            continue
+        
+        ordine = record.get('Ordine')
+        positions[key].append(int(ordine) if ordine not in ('', None) else 0)
+        session.esercizi.append(record_to_exercise(record))
+    
+    # Le righe di una sessione possono essere sparse: riordina gli esercizi
+    for key, session in sessions.items():
+        order = sorted(range(len(session.esercizi)), key=lambda i: positions[key][i])
+        session.esercizi = [session.esercizi[i] for i in order]
+    return list(sessions.values())
+
+
+def parse_legacy_history_records(records):
+    """Sessioni dal vecchio worksheet History (esercizi in Esercizi_JSON)"""
+    history = []
+    
+    for record in records:
+        if not record.get('Data'):
+            continue
+        history.append(Session.from_dict({
+            'data': record.get('Data'),
+            'giorno': record.get('Giorno'),
+            'settimana': record.get('Settimana'),
+            'esercizi': json.loads(record.get('Esercizi_JSON') or '[]')
+        }))
+    
+    return history
+
+
+def values_to_records(values, numericise=True):
+    """Converte le righe grezze di un range (header incluso) in record come get_all_records.
+    
+    Come get_all_records, i testi numerici diventano numeri ("74,50" -> 7450);
+    con numericise=False le celle restano come sono (colonne già tipizzate).
+    """
+    if not values:
+        return []
+    
+    if numericise:
+        from gspread.utils import numericise_all
+    header = values[0]
+    records = []
+    for row in values[1:]:
+        row = list(row) + [''] * (len(header) - len(row))
+        if numericise:
+            row = numericise_all(row)
+        records.append(dict(zip(header, row)))
+    return records
+
+
+# --- TRACCIAMENTO MODIFICHE ---
+def compute_data_hash(data):
+    """Hash del contenuto di una collezione di session_state"""
+    payload = json.dumps(data, ensure_ascii=False, sort_keys=True, default=to_hash_values)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+# --- SETTIMANA DELLA SCHEDA ---
+def calculate_current_week(start_date_str, current_date):
+    """Calcola la settimana corrente (1-6) basandosi sulla data di inizio"""
+    try:
+        start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+        days_since_monday = start_date.weekday()
+        monday_of_start_week = start_date - timedelta(days=days_since_monday)
+        delta_days = (current_date - monday_of_start_week).days
+        week_number = (delta_days // 7) % 6 + 1
+        return week_number
+    except:
+        return 1
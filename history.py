@@ -0,0 +1,559 @@
+"""Indici e tabelle in memoria sullo storico allenamenti e peso/calorie.
+
+Lo storico resta la lista di sessioni usata dall'app; gli indici vengono
+costruiti una volta al caricamento e aggiornati a ogni modifica, così le
+ricerche non devono più scorrere tutto lo storico.
+"""
+import bisect
+
+import pandas as pd
+
+from models import ExerciseRecord, Session
+
+# Colonne della tabella dello storico (formato lungo, una riga per esercizio)
+HISTORY_FRAME_COLUMNS = [
+    'data', 'giorno', 'settimana', 'esercizio', 'peso', 'serie_target', 'rip_target',
+    'serie_eseguite', 'rip_eseguite', 'recupero', 'completato', 'peso_kg'
+]
+
+# Colonne della tabella peso/calorie
+WEIGHT_CALORIES_FRAME_COLUMNS = ['data', 'peso', 'calorie', 'peso_kg']
+
+
+def normalize_exercise_name(name):
+    """Nome esercizio usato come chiave (senza distinzione tra maiuscole)"""
+    return (name or '').lower()
+
+
+class ExerciseEntry:
+    """Voce dello storico di un esercizio: la sessione e l'esercizio registrato.
+
+    Non copia i valori: li legge dai record dello storico.
+    """
+
+    __slots__ = ('session', 'exercise')
+
+    def __init__(self, session, exercise):
+        self.session = session
+        self.exercise = exercise
+
+    @property
+    def data(self):
+        return self.session.data
+
+    @property
+    def giorno(self):
+        return self.session.giorno
+
+    @property
+    def settimana(self):
+        return self.session.settimana
+
+    def __getattr__(self, name):
+        # peso, serie_target, rip_eseguite, ... dell'esercizio
+        if name in ExerciseRecord.__slots__:
+            return getattr(self.exercise, name)
+        raise AttributeError(name)
+
+
+def build_history_frame(sessions):
+    """Storico in formato colonnare: una riga per esercizio di ogni sessione.
+
+    Le sessioni senza esercizi hanno una riga con esercizio mancante. Date in
+    datetime (NaT se non valide) e come inserite (data_testo), giorno ed
+    esercizio categorici, peso come inserito e in kg (peso_kg, NaN se non numerico).
+    """
+    records = []
+    for session in sessions:
+        base = (session.data, session.giorno, session.settimana)
+        if not session.esercizi:
+            records.append(base + (None, '', '', '', '', '', '', False, None))
+        for ex in session.esercizi:
+            records.append(base + (
+                ex.nome,
+                ex.peso,
+                ex.serie_target,
+                ex.rip_target,
+                ex.serie_eseguite,
+                ex.rip_eseguite,
+                ex.recupero,
+                ex.completato,
+                ex.peso_kg
+            ))
+
+    frame = pd.DataFrame.from_records(records, columns=HISTORY_FRAME_COLUMNS)
+    for column in ['peso', 'serie_target', 'rip_target', 'serie_eseguite', 'rip_eseguite', 'recupero']:
+        frame[column] = frame[column].fillna('').astype(str)
+    frame['data_testo'] = frame['data'].astype(str).astype('category')
+    frame['data'] = pd.to_datetime(frame['data'], format='%Y-%m-%d', errors='coerce')
+    frame['giorno'] = frame['giorno'].astype('category')
+    frame['settimana'] = pd.to_numeric(frame['settimana'], errors='coerce').fillna(1).astype(int)
+    frame['esercizio'] = frame['esercizio'].astype('category')
+    frame['esercizio_key'] = frame['esercizio'].str.lower().astype('category')
+    frame['peso_kg'] = frame['peso_kg'].astype(float)
+    frame['completato'] = frame['completato'].astype(bool)
+    return frame
+
+
+# Colonne dello storico lette dal backend per la progressione di un esercizio
+# (nello stesso ordine di EXERCISE_FRAME_COLUMNS)
+EXERCISE_ROW_COLUMNS = [
+    'Data', 'Giorno', 'Settimana', 'Peso', 'Serie_Target', 'Rip_Target',
+    'Serie_Eseguite', 'Rip_Eseguite', 'Recupero', 'Completato', 'Peso_Kg'
+]
+EXERCISE_FRAME_COLUMNS = [
+    'data', 'giorno', 'settimana', 'peso', 'serie_target', 'rip_target',
+    'serie_eseguite', 'rip_eseguite', 'recupero', 'completato', 'peso_kg'
+]
+
+
+def build_exercise_frame(rows):
+    """Righe di un esercizio lette con load_history_rows(EXERCISE_ROW_COLUMNS).
+
+    Stesse colonne e tipi di build_history_frame (escluso l'esercizio), ordinate per data.
+    """
+    frame = pd.DataFrame.from_records(
+        [tuple(row[column] for column in EXERCISE_ROW_COLUMNS) for row in rows],
+        columns=EXERCISE_FRAME_COLUMNS
+    )
+    for column in ['peso', 'serie_target', 'rip_target', 'serie_eseguite', 'rip_eseguite', 'recupero']:
+        frame[column] = frame[column].fillna('').astype(str)
+    frame['data_testo'] = frame['data'].astype(str).astype('category')
+    frame['data'] = pd.to_datetime(frame['data'], format='%Y-%m-%d', errors='coerce')
+    frame['giorno'] = frame['giorno'].astype('category')
+    frame['settimana'] = pd.to_numeric(frame['settimana'], errors='coerce').fillna(1).astype(int)
+    frame['peso_kg'] = pd.to_numeric(frame['peso_kg'], errors='coerce').astype(float)
+    frame['completato'] = frame['completato'].fillna(False).astype(bool)
+    return frame.sort_values('data', kind='stable')
+
+
+def build_weight_calories_frame(entries):
+    """Storico peso e calorie in formato colonnare, ordinato per data.
+
+    peso e calorie restano le stringhe inserite; peso_kg e calorie_num sono
+    il peso in kg e le calorie in forma numerica (NaN se vuote o non
+    interpretabili).
+    """
+    frame = pd.DataFrame.from_records(
+        [(e.data, e.peso, e.calorie, e.peso_kg) for e in entries],
+        columns=WEIGHT_CALORIES_FRAME_COLUMNS
+    )
+    for column in ['peso', 'calorie']:
+        frame[column] = frame[column].fillna('').astype(str)
+    frame['peso_kg'] = frame['peso_kg'].astype(float)
+    frame = frame.sort_values('data', kind='stable', ignore_index=True)
+    frame['calorie_num'] = pd.to_numeric(frame['calorie'].str.strip(), errors='coerce')
+    return frame
+
+
+def _entry_date(entry):
+    return entry.session.data
+
+
+def _latest_weight(entries):
+    """Ultimo peso non vuoto tra le voci (ordinate per data)"""
+    for entry in reversed(entries):
+        peso = entry.exercise.peso
+        if peso and peso.strip():
+            return peso
+    return None
+
+
+class ExerciseIndex:
+    """Indice per esercizio: nome normalizzato -> voci ordinate per data.
+
+    Mantiene anche l'ultimo peso usato per ogni esercizio, aggiornato solo per
+    gli esercizi toccati da ogni modifica.
+    """
+
+    def __init__(self, history=()):
+        self._entries = {}
+        self._last_weight = {}
+        for session in history:
+            for exercise in session.esercizi:
+                name = normalize_exercise_name(exercise.nome)
+                self._entries.setdefault(name, []).append(ExerciseEntry(session, exercise))
+
+        # sort stabile: a parità di data resta l'ordine dello storico
+        for name, entries in self._entries.items():
+            entries.sort(key=_entry_date)
+            self._last_weight[name] = _latest_weight(entries)
+
+    def add_session(self, session):
+        """Indicizza gli esercizi di una sessione aggiunta o modificata"""
+        for exercise in session.esercizi:
+            name = normalize_exercise_name(exercise.nome)
+            entries = self._entries.setdefault(name, [])
+            bisect.insort_right(entries, ExerciseEntry(session, exercise), key=_entry_date)
+            self._last_weight[name] = _latest_weight(entries)
+
+    def remove_session(self, session):
+        """Rimuove dall'indice gli esercizi di una sessione"""
+        for name in {normalize_exercise_name(ex.nome) for ex in session.esercizi}:
+            entries = self._entries.get(name)
+            if not entries:
+                continue
+            lo = bisect.bisect_left(entries, session.data, key=_entry_date)
+            hi = bisect.bisect_right(entries, session.data, key=_entry_date)
+            entries[lo:hi] = [e for e in entries[lo:hi] if e.giorno != session.giorno]
+            self._last_weight[name] = _latest_weight(entries)
+
+    def get(self, exercise_name):
+        """Voci di un esercizio ordinate per data"""
+        return list(self._entries.get(normalize_exercise_name(exercise_name), []))
+
+    def last_weight(self, exercise_name):
+        """Ultimo peso non vuoto usato per un esercizio (None se assente)"""
+        return self._last_weight.get(normalize_exercise_name(exercise_name))
+
+
+# Colonne dei carichi: una riga per esercizio registrato
+LOAD_COLUMNS = [
+    'esercizio_key', 'data', 'giorno', 'settimana', 'inizio_settimana',
+    'peso_kg', 'serie', 'ripetizioni', 'volume', 'e1rm'
+]
+
+# Colonne dei rollup settimanali di un esercizio
+WEEK_LOAD_COLUMNS = ['inizio_settimana', 'volume', 'ripetizioni', 'serie', 'e1rm', 'sessioni']
+
+# Giorni di un ciclo della scheda (6 settimane)
+CYCLE_DAYS = 42
+
+
+def estimate_1rm(peso_kg, ripetizioni):
+    """1RM stimato con la formula di Epley (NaN senza peso o ripetizioni)"""
+    e1rm = peso_kg * (1 + ripetizioni / 30)
+    e1rm = e1rm.where(ripetizioni > 1, peso_kg)
+    return e1rm.where((ripetizioni >= 1) & (peso_kg > 0))
+
+
+def compute_loads(frame):
+    """Carichi degli esercizi della tabella dello storico, in blocco.
+
+    Le ripetizioni vengono da rip_eseguite ("4,4,4,4,4"); un solo numero con
+    più serie eseguite vale per ogni serie; senza ripetizioni annotate ma con
+    l'obiettivo raggiunto valgono serie e ripetizioni target. Volume = somma
+    delle ripetizioni × peso (kg); e1rm dalla serie con più ripetizioni.
+    """
+    rows = frame[frame['esercizio'].notna() & frame['data'].notna()]
+    if rows.empty:
+        return pd.DataFrame(columns=LOAD_COLUMNS)
+
+    reps = rows['rip_eseguite'].str.split(',', expand=True)
+    reps = reps.apply(lambda column: pd.to_numeric(column.str.strip(), errors='coerce'))
+    counted = reps.notna().sum(axis=1)
+    total = reps.sum(axis=1)
+    best = reps.max(axis=1)
+    sets = counted.astype(float)
+
+    serie = pd.to_numeric(rows['serie_eseguite'].str.strip(), errors='coerce')
+    single = (counted == 1) & (serie > 1)
+    total = total.where(~single, best * serie)
+    sets = sets.where(~single, serie)
+
+    target_reps = pd.to_numeric(rows['rip_target'].str.strip(), errors='coerce')
+    target_sets = pd.to_numeric(rows['serie_target'].str.strip(), errors='coerce')
+    target = (counted == 0) & rows['completato']
+    total = total.where(~target, target_reps * target_sets)
+    sets = sets.where(~target, target_sets)
+    best = best.where(~target, target_reps)
+
+    dates = rows['data']
+    return pd.DataFrame({
+        'esercizio_key': rows['esercizio_key'].astype(str),
+        'data': dates,
+        'giorno': rows['giorno'].astype(str),
+        'settimana': rows['settimana'],
+        'inizio_settimana': dates - pd.to_timedelta(dates.dt.weekday, unit='D'),
+        'peso_kg': rows['peso_kg'],
+        'serie': sets,
+        'ripetizioni': total,
+        'volume': total * rows['peso_kg'],
+        'e1rm': estimate_1rm(rows['peso_kg'], best),
+    }, columns=LOAD_COLUMNS)
+
+
+def _to_dates(values):
+    """datetime.date da una colonna di date (conversione in blocco)"""
+    return values.to_numpy().astype('datetime64[D]').tolist()
+
+
+def _cycle_numbers(week_starts, start_date):
+    """Ciclo di 6 settimane (da 1) di ogni settimana, contando dalla data di inizio scheda"""
+    if week_starts.empty:
+        return pd.Series(index=week_starts.index, dtype=int)
+    start = pd.to_datetime(start_date, format='%Y-%m-%d', errors='coerce')
+    if pd.isna(start):
+        start = week_starts.min()
+    start -= pd.Timedelta(days=start.weekday())
+    return (week_starts - start).dt.days // CYCLE_DAYS + 1
+
+
+def _sum(values):
+    """Somma che ignora i NaN, come pandas"""
+    return sum((v for v in values if v == v), 0.0)
+
+
+class TrainingLoad:
+    """Rollup dei carichi per esercizio e settimana e per giorno e settimana.
+
+    Vengono calcolati in blocco alla costruzione. Le sessioni modificate si
+    tolgono e si riaggiungono (come in ExerciseIndex) e si ricalcolano solo
+    le settimane che toccano, dalle poche sessioni che contengono. Le viste
+    restano in cache finché i loro dati non cambiano.
+    """
+
+    def __init__(self, sessions=()):
+        self._by_session = {}      # (data, giorno) -> [(esercizio, settimana, volume, ripetizioni, serie, e1rm)]
+        self._week_sessions = {}   # inizio settimana -> {(data, giorno)}
+        self._weeks = {}           # esercizio -> {inizio settimana: (volume, ripetizioni, serie, e1rm, sessioni)}
+        self._days = {}            # (giorno, inizio settimana) -> tonnellaggio
+        self._views = {}           # esercizio (None per i giorni) -> {vista: tabella}
+
+        loads = compute_loads(build_history_frame(sessions))
+        keys = list(zip(_to_dates(loads['data']), loads['giorno'].tolist()))
+        week_starts = _to_dates(loads['inizio_settimana'])
+        rows = zip(
+            loads['esercizio_key'].tolist(), week_starts, loads['volume'].tolist(),
+            loads['ripetizioni'].tolist(), loads['serie'].tolist(), loads['e1rm'].tolist()
+        )
+        for key, week, row in zip(keys, week_starts, rows):
+            self._by_session.setdefault(key, []).append(row)
+            self._week_sessions.setdefault(week, set()).add(key)
+
+        weeks = loads.groupby(['esercizio_key', 'inizio_settimana']).agg(
+            volume=('volume', 'sum'),
+            ripetizioni=('ripetizioni', 'sum'),
+            serie=('serie', 'sum'),
+            e1rm=('e1rm', 'max'),
+            sessioni=('data', 'size'),
+        )
+        names = weeks.index.get_level_values(0).tolist()
+        for name, week, totals in zip(names, _to_dates(weeks.index.get_level_values(1)),
+                                      weeks.itertuples(index=False, name=None)):
+            self._weeks.setdefault(name, {})[week] = totals
+
+        days = loads.groupby(['giorno', 'inizio_settimana'], observed=True)['volume'].sum()
+        self._days = dict(zip(
+            zip(days.index.get_level_values(0).tolist(), _to_dates(days.index.get_level_values(1))),
+            days.tolist()
+        ))
+
+    @staticmethod
+    def _session_key(session):
+        data = pd.to_datetime(session.data, format='%Y-%m-%d', errors='coerce')
+        return None if pd.isna(data) else (data.date(), session.giorno)
+
+    def _refresh(self, week):
+        """Ricalcola i rollup di una settimana dalle sue sessioni e invalida le viste"""
+        exercises = {}
+        days = {}
+        for key in self._week_sessions.get(week, ()):
+            for row in self._by_session[key]:
+                exercises.setdefault(row[0], []).append(row)
+                days.setdefault(key[1], []).append(row[2])
+
+        for name, weeks in self._weeks.items():
+            if week in weeks and name not in exercises:
+                del weeks[week]
+                self._views.pop(name, None)
+        for name, rows in exercises.items():
+            e1rm = [row[5] for row in rows if row[5] == row[5]]
+            self._weeks.setdefault(name, {})[week] = (
+                _sum(row[2] for row in rows),
+                _sum(row[3] for row in rows),
+                _sum(row[4] for row in rows),
+                max(e1rm) if e1rm else float('nan'),
+                len(rows),
+            )
+            self._views.pop(name, None)
+
+        for day, week_start in [k for k in self._days if k[1] == week]:
+            if day not in days:
+                del self._days[(day, week_start)]
+        for day, volumes in days.items():
+            self._days[(day, week)] = _sum(volumes)
+        self._views.pop(None, None)
+
+    def add_session(self, session):
+        """Aggiunge ai rollup i carichi di una sessione aggiunta o modificata"""
+        key = self._session_key(session)
+        loads = compute_loads(build_history_frame([session]))
+        if key is None or loads.empty:
+            return
+        week_starts = _to_dates(loads['inizio_settimana'])
+        week = week_starts[0]
+        self._by_session[key] = list(zip(
+            loads['esercizio_key'].tolist(), week_starts,
+            loads['volume'].tolist(), loads['ripetizioni'].tolist(),
+            loads['serie'].tolist(), loads['e1rm'].tolist()
+        ))
+        self._week_sessions.setdefault(week, set()).add(key)
+        self._refresh(week)
+
+    def remove_session(self, session):
+        """Toglie dai rollup i carichi di una sessione"""
+        key = self._session_key(session)
+        rows = self._by_session.pop(key, None)
+        if not rows:
+            return
+        week = rows[0][1]
+        self._week_sessions[week].discard(key)
+        self._refresh(week)
+
+    def _view(self, owner, view, build):
+        views = self._views.setdefault(owner, {})
+        if view not in views:
+            views[view] = build()
+        return views[view]
+
+    def exercise_weeks(self, exercise_name):
+        """Rollup settimanale di un esercizio, ordinato per settimana"""
+        name = normalize_exercise_name(exercise_name)
+
+        def build():
+            frame = pd.DataFrame(
+                [(week,) + totals for week, totals in self._weeks.get(name, {}).items()],
+                columns=WEEK_LOAD_COLUMNS
+            )
+            frame['inizio_settimana'] = pd.to_datetime(frame['inizio_settimana'])
+            return frame.sort_values('inizio_settimana', ignore_index=True)
+        return self._view(name, 'settimane', build)
+
+    def exercise_cycles(self, exercise_name, start_date):
+        """Rollup per ciclo di 6 settimane di un esercizio"""
+        name = normalize_exercise_name(exercise_name)
+
+        def build():
+            weeks = self.exercise_weeks(exercise_name)
+            cycles = weeks.groupby(_cycle_numbers(weeks['inizio_settimana'], start_date)).agg(
+                dal=('inizio_settimana', 'min'),
+                settimane=('inizio_settimana', 'size'),
+                volume=('volume', 'sum'),
+                ripetizioni=('ripetizioni', 'sum'),
+                e1rm=('e1rm', 'max'),
+            )
+            return cycles.rename_axis('ciclo').reset_index()
+        return self._view(name, ('cicli', start_date), build)
+
+    def day_tonnage(self, start_date):
+        """Tonnellaggio per ciclo (righe) e giorno della scheda (colonne)"""
+        def build():
+            frame = pd.DataFrame(
+                [(day, week, volume) for (day, week), volume in self._days.items()],
+                columns=['giorno', 'inizio_settimana', 'tonnellaggio']
+            )
+            frame['inizio_settimana'] = pd.to_datetime(frame['inizio_settimana'])
+            frame['ciclo'] = _cycle_numbers(frame['inizio_settimana'], start_date)
+            return frame.pivot_table(
+                index='ciclo', columns='giorno', values='tonnellaggio', aggfunc='sum', fill_value=0
+            )
+        return self._view(None, ('giorni', start_date), build)
+
+
+class HistoryRepository:
+    """Storico delle sessioni con indici per (data, giorno) e per esercizio.
+
+    sessions è la stessa lista usata dalle viste e dal salvataggio: va
+    modificata solo tramite i metodi del repository, così gli indici restano
+    coerenti con il suo contenuto.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        # Incrementata a ogni modifica: identifica la versione dei dati
+        self.version = 0
+        self._by_key = {}
+        self._exercise_positions = {}
+        self._days_by_date = {}  # data -> giorni con una sessione indicizzata
+        for session in sessions:
+            key = (session.data, session.giorno)
+            if key not in self._by_key:
+                self._index_session(session)
+        self.exercises = ExerciseIndex(sessions)
+        self._training_load = None
+
+    @property
+    def training_load(self):
+        """Rollup dei carichi, costruiti al primo uso e poi aggiornati a ogni modifica"""
+        if self._training_load is None:
+            self._training_load = TrainingLoad(self.sessions)
+        return self._training_load
+
+    def _index_session(self, session):
+        key = (session.data, session.giorno)
+        self._by_key[key] = session
+        self._days_by_date.setdefault(session.data, set()).add(session.giorno)
+        positions = {}
+        for i, exercise in enumerate(session.esercizi):
+            positions.setdefault(exercise.nome, i)
+        self._exercise_positions[key] = positions
+
+    def _remove_session(self, session):
+        # Per identità (e dal fondo, dove stanno le sessioni recenti): due
+        # sessioni distinte possono essere uguali come valori
+        for i in range(len(self.sessions) - 1, -1, -1):
+            if self.sessions[i] is session:
+                del self.sessions[i]
+                return
+
+    def get_session(self, date_str, day):
+        """Sessione di una data e un giorno (None se assente)"""
+        return self._by_key.get((date_str, day))
+
+    def get_exercise(self, date_str, day, exercise_name):
+        """Esercizio registrato in una sessione (None se assente)"""
+        key = (date_str, day)
+        position = self._exercise_positions.get(key, {}).get(exercise_name)
+        if position is None:
+            return None
+        return self._by_key[key].esercizi[position]
+
+    def upsert_exercise(self, date_str, day, week_number, exercise_data):
+        """Registra un esercizio nella sessione del giorno (creandola se serve)"""
+        key = (date_str, day)
+        session = self._by_key.get(key)
+
+        if session is None:
+            session = Session(date_str, day, week_number)
+            self.sessions.append(session)
+            self._index_session(session)
+        else:
+            self.exercises.remove_session(session)
+            if self._training_load is not None:
+                self._training_load.remove_session(session)
+
+        # Aggiorna esercizio esistente o aggiungine uno nuovo
+        positions = self._exercise_positions[key]
+        position = positions.get(exercise_data.nome)
+        if position is not None:
+            session.esercizi[position] = exercise_data
+        else:
+            positions[exercise_data.nome] = len(session.esercizi)
+            session.esercizi.append(exercise_data)
+
+        self.exercises.add_session(session)
+        if self._training_load is not None:
+            self._training_load.add_session(session)
+        self.version += 1
+        return session
+
+    def replace_date(self, date_str, day, week_number, exercises_data):
+        """Sostituisce gli allenamenti di una data con una nuova sessione"""
+        for giorno in self._days_by_date.pop(date_str, ()):
+            key = (date_str, giorno)
+            session = self._by_key.pop(key)
+            del self._exercise_positions[key]
+            self.exercises.remove_session(session)
+            if self._training_load is not None:
+                self._training_load.remove_session(session)
+            self._remove_session(session)
+
+        session = Session(date_str, day, week_number, exercises_data)
+        self.sessions.append(session)
+        self._index_session(session)
+        self.exercises.add_session(session)
+        if self._training_load is not None:
+            self._training_load.add_session(session)
+        self.version += 1
+        return session
@@ -0,0 +1,144 @@
+"""Record compatti dello storico: sessioni, esercizi registrati e misure di peso/calorie.
+
+Classi con __slots__ al posto dei dict: ogni istanza non ripete i nomi dei
+campi, così gli storici pluriennali tenuti in session_state occupano meno
+memoria. Nei file JSON (snapshot, giornale, SQLite) i record restano dict con
+le stesse chiavi di prima; le conversioni da/verso le righe dei fogli sono in
+core.
+"""
+import sys
+from dataclasses import dataclass, field
+from operator import attrgetter
+
+from units import format_kg, legacy_body_weight_kg, parse_kg
+
+
+@dataclass(slots=True)
+class ExerciseRecord:
+    """Esercizio registrato in una sessione (valori stringa come inseriti, peso_kg in kg)"""
+    nome: str = ''
+    serie_target: str = ''
+    rip_target: str = ''
+    recupero: str = ''
+    peso: str = ''
+    serie_eseguite: str = ''
+    rip_eseguite: str = ''
+    completato: bool = False
+    peso_kg: float | None = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            nome=sys.intern(str(data.get('nome') or '')),
+            serie_target=data.get('serie_target', ''),
+            rip_target=data.get('rip_target', ''),
+            recupero=sys.intern(str(data.get('recupero') or '')),
+            peso=data.get('peso', ''),
+            serie_eseguite=data.get('serie_eseguite', ''),
+            rip_eseguite=data.get('rip_eseguite', ''),
+            completato=bool(data.get('completato', False)),
+            # Record salvati prima di peso_kg: lo ricava dalla stringa
+            peso_kg=data['peso_kg'] if 'peso_kg' in data else parse_kg(data.get('peso'))
+        )
+
+    def to_dict(self):
+        return {
+            'nome': self.nome,
+            'serie_target': self.serie_target,
+            'rip_target': self.rip_target,
+            'recupero': self.recupero,
+            'peso': self.peso,
+            'serie_eseguite': self.serie_eseguite,
+            'rip_eseguite': self.rip_eseguite,
+            'completato': self.completato,
+            'peso_kg': self.peso_kg
+        }
+
+
+@dataclass(slots=True)
+class Session:
+    """Sessione di allenamento di una data e un giorno della scheda"""
+    data: str
+    giorno: str
+    settimana: int = 1
+    esercizi: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data=data.get('data'),
+            giorno=sys.intern(str(data.get('giorno') or '')),
+            settimana=int(data.get('settimana') or 1),
+            esercizi=[ExerciseRecord.from_dict(ex) for ex in data.get('esercizi') or []]
+        )
+
+    def to_dict(self):
+        return {
+            'data': self.data,
+            'giorno': self.giorno,
+            'settimana': self.settimana,
+            'esercizi': [ex.to_dict() for ex in self.esercizi]
+        }
+
+
+@dataclass(slots=True)
+class WeightEntry:
+    """Misura di peso e calorie di un giorno (peso come inserito, peso_kg in kg)"""
+    data: str
+    peso: str = ''
+    calorie: str = ''
+    peso_kg: float | None = None
+
+    @classmethod
+    def from_dict(cls, data):
+        peso = data.get('peso', '')
+        if 'peso_kg' in data:
+            peso_kg = data['peso_kg']
+        else:
+            # Misure salvate nel vecchio formato (centesimi di kg)
+            peso_kg = legacy_body_weight_kg(peso)
+            if peso_kg is not None:
+                peso = format_kg(peso_kg)
+        return cls(data=data.get('data'), peso=peso, calorie=data.get('calorie', ''), peso_kg=peso_kg)
+
+    def to_dict(self):
+        return {'data': self.data, 'peso': self.peso, 'calorie': self.calorie, 'peso_kg': self.peso_kg}
+
+
+def history_from_json(sessions):
+    """Sessioni dai dict JSON (snapshot, giornale)"""
+    return [Session.from_dict(session) for session in sessions]
+
+
+def weight_calories_from_json(entries):
+    """Misure di peso e calorie dai dict JSON (snapshot, giornale)"""
+    return [WeightEntry.from_dict(entry) for entry in entries]
+
+
+# Collezioni di session_state composte da record
+COLLECTION_RECORDS = {
+    'workout_history': history_from_json,
+    'weight_calories_history': weight_calories_from_json,
+}
+
+
+def collection_from_json(key, value):
+    """Collezione letta da JSON con i record ricostruiti (le altre restano invariate)"""
+    from_json = COLLECTION_RECORDS.get(key)
+    return from_json(value) if from_json else value
+
+
+def to_json(value):
+    """default per json.dumps: i record diventano dict, il resto stringa"""
+    to_dict = getattr(value, 'to_dict', None)
+    return to_dict() if to_dict else str(value)
+
+
+# Lettura di tutti i campi di un record in un colpo solo
+_RECORD_FIELDS = {cls: attrgetter(*cls.__slots__) for cls in (ExerciseRecord, Session, WeightEntry)}
+
+
+def to_hash_values(value):
+    """default per json.dumps negli hash: valori dei campi dei record, senza chiavi"""
+    fields = _RECORD_FIELDS.get(type(value))
+    return fields(value) if fields else str(value)
@@ -0,0 +1,119 @@
+"""Misure dei tempi delle operazioni principali dell'app.
+
+Ogni span (caricamento, salvataggio, ricerca, rendering di una pagina) tiene
+le ultime durate in una finestra mobile; da queste si ricavano statistiche e
+istogramma. Il registro è unico per il processo ed è usato anche dai thread
+di salvataggio in background.
+"""
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Limiti superiori (ms) delle classi dell'istogramma
+HISTOGRAM_BUCKETS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000]
+
+
+class SpanRecorder:
+    """Durate recenti per span, in una finestra mobile di window misure"""
+
+    def __init__(self, window=500):
+        self.window = window
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            samples = self._spans.get(name)
+            if samples is None:
+                samples = self._spans[name] = deque(maxlen=self.window)
+            samples.append(seconds * 1000)
+
+    @contextmanager
+    def span(self, name):
+        """Misura la durata del blocco with"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name=None):
+        """Decoratore: misura ogni chiamata della funzione"""
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def samples(self, name):
+        """Durate (ms) nella finestra di uno span"""
+        with self._lock:
+            return list(self._spans.get(name, ()))
+
+    def histogram(self, name):
+        """Conteggi per classe di durata: lista di (etichetta, conteggio)"""
+        samples = self.samples(name)
+        labels = [f"≤{limit} ms" for limit in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]} ms"]
+        counts = [0] * len(labels)
+        for value in samples:
+            for i, limit in enumerate(HISTOGRAM_BUCKETS_MS):
+                if value <= limit:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return list(zip(labels, counts))
+
+    def summary(self):
+        """Statistiche per span (ms): lista di dict ordinata per tempo totale"""
+        with self._lock:
+            spans = {name: sorted(samples) for name, samples in self._spans.items()}
+
+        rows = []
+        for name, samples in spans.items():
+            if not samples:
+                continue
+            rows.append({
+                'span': name,
+                'n': len(samples),
+                'media_ms': round(sum(samples) / len(samples), 2),
+                'p50_ms': round(samples[len(samples) // 2], 2),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+                'max_ms': round(samples[-1], 2),
+                'totale_ms': round(sum(samples), 2),
+            })
+        rows.sort(key=lambda row: row['totale_ms'], reverse=True)
+        return rows
+
+    def to_json(self):
+        """Statistiche, istogrammi e durate grezze in formato JSON"""
+        with self._lock:
+            names = list(self._spans)
+        return json.dumps({
+            'window': self.window,
+            'summary': self.summary(),
+            'spans': {
+                name: {
+                    'samples_ms': [round(value, 3) for value in self.samples(name)],
+                    'histogram': dict(self.histogram(name)),
+                }
+                for name in names
+            },
+        }, ensure_ascii=False, indent=2)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+# Registro condiviso dal processo
+RECORDER = SpanRecorder()
+span = RECORDER.span
+timed = RECORDER.timed
@@ -0,0 +1,167 @@
+"""Accesso controllato alle API di Google Sheets.
+
+Tutte le richieste HTTP di gspread passano da SheetsGateway: un token bucket
+mantiene la frequenza entro la quota delle API, gli errori temporanei (429,
+5xx, problemi di rete) vengono ritentati con backoff esponenziale e jitter e
+ogni chiamata viene contata per tipo. Le chiamate non idempotenti (append,
+batchUpdate) si ritentano solo quando la quota le ha rifiutate.
+"""
+import random
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+# Chiamate che, se ripetute dopo un timeout o un 5xx, possono essere applicate
+# due volte (righe aggiunte o cancellate di nuovo)
+NON_IDEMPOTENT_CALLS = {'POST values:append', 'POST batchUpdate'}
+
+
+def request_label(method, endpoint):
+    """Tipo di chiamata per i contatori (es. 'GET values:batchGet', 'POST values:append')"""
+    path = endpoint.split('?', 1)[0].rstrip('/')
+    last = path.rsplit('/', 1)[-1]
+    if '/values' in path:
+        operation = 'values:' + last.rsplit(':', 1)[1] if ':' in last else 'values'
+    elif ':' in last:
+        operation = last.rsplit(':', 1)[1]
+    elif 'googleapis.com/drive' in path:
+        operation = 'drive'
+    else:
+        operation = 'metadata'
+    return f"{method.upper()} {operation}"
+
+
+def is_retryable(error, idempotent=True):
+    """True se l'errore è temporaneo (quota, timeout, errore del server).
+
+    Con idempotent=False solo i rifiuti per quota (429, 403 usageLimits), in cui
+    la richiesta non è stata eseguita: dopo un timeout o un 5xx potrebbe esserlo.
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return idempotent
+    if not isinstance(error, APIError):
+        return False
+    if error.code == HTTPStatus.TOO_MANY_REQUESTS:
+        return True
+    if error.code == HTTPStatus.REQUEST_TIMEOUT or error.code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+        return idempotent
+    # Drive segnala i limiti di utilizzo con 403
+    details = error.error.get('errors') or [{}]
+    return error.code == HTTPStatus.FORBIDDEN and details[0].get('domain') == 'usageLimits'
+
+
+def retry_after(error):
+    """Attesa suggerita dal server (header Retry-After), se presente"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Limitatore a token bucket: rate token al secondo, al massimo capacity accumulati"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Consuma un token, attendendo se necessario; ritorna i secondi attesi"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RequestStats:
+    """Contatori per tipo di chiamata: richieste, nuovi tentativi, errori, attese"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.retries = Counter()
+        self.errors = Counter()
+        self.throttled_seconds = Counter()
+
+    def record(self, counter, label, amount=1):
+        with self._lock:
+            getattr(self, counter)[label] += amount
+
+    def snapshot(self):
+        """Lista di dict, uno per tipo di chiamata"""
+        with self._lock:
+            return [
+                {
+                    'chiamata': label,
+                    'richieste': self.calls[label],
+                    'tentativi': self.retries[label],
+                    'errori': self.errors[label],
+                    'attesa_s': round(self.throttled_seconds[label], 2),
+                }
+                for label in sorted(self.calls)
+            ]
+
+
+class SheetsGateway:
+    """Punto di passaggio unico delle richieste verso Google Sheets"""
+
+    def __init__(self, requests_per_minute=60, burst=10, max_retries=5,
+                 base_delay=1.0, max_delay=32.0):
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.stats = RequestStats()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def call(self, label, request):
+        """Esegue request() rispettando la quota e ritentando gli errori temporanei"""
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire()
+            if waited:
+                self.stats.record('throttled_seconds', label, waited)
+            self.stats.record('calls', label)
+            try:
+                return request()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e, label not in NON_IDEMPOTENT_CALLS):
+                    self.stats.record('errors', label)
+                    raise
+                # Backoff esponenziale con jitter completo
+                delay = retry_after(e) or random.uniform(
+                    0, min(self.max_delay, self.base_delay * 2 ** attempt)
+                )
+                self.stats.record('retries', label)
+                attempt += 1
+                time.sleep(delay)
+
+    def http_client_class(self):
+        """Client HTTP per gspread.authorize che instrada ogni richiesta dal gateway"""
+        gateway = self
+
+        class GatewayHTTPClient(HTTPClient):
+            def request(self, method, endpoint, *args, **kwargs):
+                return gateway.call(
+                    request_label(method, endpoint),
+                    lambda: super(GatewayHTTPClient, self).request(method, endpoint, *args, **kwargs)
+                )
+
+        return GatewayHTTPClient
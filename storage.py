@@ -0,0 +1,530 @@
+"""Backend di persistenza dei dati del Workout Tracker.
+
+Ogni backend carica e salva le quattro collezioni dell'app (template,
+storico, data inizio scheda, peso/calorie) come strutture Python semplici e
+record di models, senza dipendere da Streamlit.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+from models import ExerciseRecord, Session, WeightEntry, collection_from_json, to_json
+from units import format_kg, legacy_body_weight_kg, parse_kg
+
+# Collezioni di session_state gestite dai backend
+COLLECTIONS = [
+    'workout_template',
+    'workout_history',
+    'data_inizio_scheda',
+    'weight_calories_history',
+]
+
+
+class StorageBackend:
+    """Interfaccia comune dei backend di persistenza"""
+
+    name = ''
+    # True se le letture non passano dalla rete (letture parziali economiche)
+    local = False
+
+    def load_all(self):
+        """Carica tutte le collezioni.
+
+        Ritorna un dict collezione -> valore (le collezioni assenti vengono
+        omesse) oppure None se il caricamento non è riuscito.
+        """
+        raise NotImplementedError
+
+    def save(self, key, value):
+        """Salva una collezione; ritorna True se il salvataggio è riuscito"""
+        raise NotImplementedError
+
+    def load_history_rows(self, columns, exercise=None):
+        """Legge solo le colonne richieste dello storico, una riga per esercizio.
+
+        columns usa i nomi delle colonne del worksheet HistoryRows (es. 'Data',
+        'Peso'); exercise filtra per nome esercizio (senza distinguere maiuscole).
+        """
+        raise NotImplementedError
+
+
+class SQLiteBackend(StorageBackend):
+    """Backend su database SQLite locale"""
+
+    name = 'sqlite'
+    local = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS template (
+            giorno TEXT PRIMARY KEY,
+            esercizi_json TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            giorno TEXT NOT NULL,
+            settimana INTEGER NOT NULL DEFAULT 1,
+            UNIQUE (data, giorno)
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_giorno ON sessions (giorno);
+        CREATE TABLE IF NOT EXISTS session_exercises (
+            session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+            posizione INTEGER NOT NULL,
+            nome TEXT NOT NULL,
+            esercizio_json TEXT NOT NULL,
+            PRIMARY KEY (session_id, posizione)
+        );
+        CREATE INDEX IF NOT EXISTS idx_session_exercises_nome
+            ON session_exercises (nome COLLATE NOCASE);
+        CREATE TABLE IF NOT EXISTS config (
+            chiave TEXT PRIMARY KEY,
+            valore TEXT
+        );
+        CREATE TABLE IF NOT EXISTS weight_calories (
+            data TEXT PRIMARY KEY,
+            peso TEXT NOT NULL DEFAULT '',
+            calorie TEXT NOT NULL DEFAULT '',
+            peso_kg REAL
+        );
+    """
+
+    # Colonne dello storico -> espressioni SQL
+    HISTORY_COLUMNS = {
+        'Data': "s.data",
+        'Giorno': "s.giorno",
+        'Settimana': "s.settimana",
+        'Esercizio': "e.nome",
+        'Ordine': "e.posizione",
+        'Peso': "json_extract(e.esercizio_json, '$.peso')",
+        'Peso_Kg': "json_extract(e.esercizio_json, '$.peso_kg')",
+        'Serie_Target': "json_extract(e.esercizio_json, '$.serie_target')",
+        'Rip_Target': "json_extract(e.esercizio_json, '$.rip_target')",
+        'Serie_Eseguite': "json_extract(e.esercizio_json, '$.serie_eseguite')",
+        'Rip_Eseguite': "json_extract(e.esercizio_json, '$.rip_eseguite')",
+        'Recupero': "json_extract(e.esercizio_json, '$.recupero')",
+        'Completato': "json_extract(e.esercizio_json, '$.completato')",
+    }
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.executescript(self.SCHEMA)
+            with conn:
+                self._migrate_kg(conn)
+
+    def _connect(self):
+        # Una connessione per operazione: il backend è usato da più thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def _migrate_kg(self, conn):
+        """Migrazione una tantum dei database creati prima dei chili canonici"""
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(weight_calories)")]
+        if 'peso_kg' in columns:
+            return
+
+        conn.execute("ALTER TABLE weight_calories ADD COLUMN peso_kg REAL")
+        updates = []
+        for data, peso in conn.execute("SELECT data, peso FROM weight_calories").fetchall():
+            peso_kg = legacy_body_weight_kg(peso)
+            if peso_kg is not None:
+                updates.append((format_kg(peso_kg), peso_kg, data))
+        conn.executemany("UPDATE weight_calories SET peso = ?, peso_kg = ? WHERE data = ?", updates)
+
+        conn.executemany(
+            "UPDATE session_exercises SET esercizio_json = json_set(esercizio_json, '$.peso_kg', ?) "
+            "WHERE session_id = ? AND posizione = ?",
+            [
+                (parse_kg(json.loads(esercizio_json).get('peso')), session_id, posizione)
+                for session_id, posizione, esercizio_json in conn.execute(
+                    "SELECT session_id, posizione, esercizio_json FROM session_exercises"
+                ).fetchall()
+            ]
+        )
+
+    def load_all(self):
+        with closing(self._connect()) as conn:
+            template = {
+                giorno: json.loads(esercizi_json)
+                for giorno, esercizi_json in conn.execute(
+                    "SELECT giorno, esercizi_json FROM template"
+                )
+            }
+
+            history = []
+            sessions_by_id = {}
+            for session_id, data, giorno, settimana in conn.execute(
+                "SELECT id, data, giorno, settimana FROM sessions ORDER BY id"
+            ):
+                session = Session(data, giorno, settimana)
+                sessions_by_id[session_id] = session
+                history.append(session)
+
+            for session_id, esercizio_json in conn.execute(
+                "SELECT session_id, esercizio_json FROM session_exercises "
+                "ORDER BY session_id, posizione"
+            ):
+                sessions_by_id[session_id].esercizi.append(
+                    ExerciseRecord.from_dict(json.loads(esercizio_json))
+                )
+
+            weight_calories = [
+                WeightEntry(data, peso, calorie, peso_kg)
+                for data, peso, calorie, peso_kg in conn.execute(
+                    "SELECT data, peso, calorie, peso_kg FROM weight_calories ORDER BY data"
+                )
+            ]
+
+            data = {
+                'workout_template': template,
+                'workout_history': history,
+                'weight_calories_history': weight_calories,
+            }
+
+            row = conn.execute(
+                "SELECT valore FROM config WHERE chiave = 'data_inizio_scheda'"
+            ).fetchone()
+            if row:
+                data['data_inizio_scheda'] = row[0]
+
+        return data
+
+    def load_history_rows(self, columns, exercise=None):
+        select = ", ".join(self.HISTORY_COLUMNS[column] for column in columns)
+        query = (
+            f"SELECT {select} FROM session_exercises e "
+            "JOIN sessions s ON s.id = e.session_id"
+        )
+        params = ()
+        if exercise is not None:
+            query += " WHERE e.nome = ? COLLATE NOCASE"
+            params = (exercise,)
+        query += " ORDER BY s.data, e.posizione"
+
+        with closing(self._connect()) as conn:
+            return [dict(zip(columns, row)) for row in conn.execute(query, params)]
+
+    def save(self, key, value):
+        savers = {
+            'workout_template': self._save_template,
+            'workout_history': self._save_history,
+            'data_inizio_scheda': self._save_config,
+            'weight_calories_history': self._save_weight_calories,
+        }
+        with closing(self._connect()) as conn:
+            with conn:  # transazione: commit o rollback
+                savers[key](conn, value)
+        return True
+
+    def _save_template(self, conn, template):
+        conn.execute("DELETE FROM template")
+        conn.executemany(
+            "INSERT INTO template (giorno, esercizi_json) VALUES (?, ?)",
+            [
+                (day, json.dumps(exercises, ensure_ascii=False))
+                for day, exercises in template.items() if exercises
+            ]
+        )
+
+    def _save_history(self, conn, history):
+        conn.execute("DELETE FROM sessions")
+        for session in history:
+            cursor = conn.execute(
+                "INSERT OR REPLACE INTO sessions (data, giorno, settimana) VALUES (?, ?, ?)",
+                (session.data, session.giorno, session.settimana)
+            )
+            conn.executemany(
+                "INSERT INTO session_exercises (session_id, posizione, nome, esercizio_json) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (cursor.lastrowid, i, ex.nome, json.dumps(ex.to_dict(), ensure_ascii=False))
+                    for i, ex in enumerate(session.esercizi)
+                ]
+            )
+
+    def _save_config(self, conn, data_inizio_scheda):
+        conn.execute(
+            "INSERT OR REPLACE INTO config (chiave, valore) VALUES ('data_inizio_scheda', ?)",
+            (data_inizio_scheda,)
+        )
+
+    def _save_weight_calories(self, conn, entries):
+        conn.execute("DELETE FROM weight_calories")
+        conn.executemany(
+            "INSERT OR REPLACE INTO weight_calories (data, peso, calorie, peso_kg) VALUES (?, ?, ?, ?)",
+            [(e.data, e.peso, e.calorie, e.peso_kg) for e in entries]
+        )
+
+
+class MirroredBackend(StorageBackend):
+    """Legge dal backend primario e replica ogni salvataggio su un secondo backend"""
+
+    def __init__(self, primary, mirror):
+        self.primary = primary
+        self.mirror = mirror
+        self.name = f"{primary.name}+{mirror.name}"
+        self.local = primary.local
+
+    def load_all(self):
+        data = self.primary.load_all()
+        if data is not None and not any(data.values()):
+            # Primario vuoto (es. primo avvio): importa i dati dal mirror
+            mirrored = self.mirror.load_all()
+            if mirrored:
+                for key, value in mirrored.items():
+                    self.primary.save(key, value)
+                data = mirrored
+        return data
+
+    def save(self, key, value):
+        return self.primary.save(key, value) and self.mirror.save(key, value)
+
+    def load_history_rows(self, columns, exercise=None):
+        return self.primary.load_history_rows(columns, exercise)
+
+
+class LocalSnapshot:
+    """Copia locale (file JSON) delle collezioni dell'ultimo caricamento riuscito"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Collezioni salvate nello snapshot (None se assente o illeggibile)"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return {key: collection_from_json(key, value) for key, value in data.items()}
+
+    def save(self, data):
+        # Scrittura su file temporaneo e rename: lo snapshot non resta mai a metà
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, default=to_json)
+            os.replace(tmp_path, self.path)
+
+
+# Record delle voci del giornale per tipo di modifica ('set': collezione intera)
+MUTATION_RECORDS = {'upsert_exercise': Session, 'replace_date': Session, 'put_weight': WeightEntry}
+
+# Righe già confermate o superate oltre le quali il giornale viene riscritto
+JOURNAL_COMPACT_LINES = 100
+
+
+def mutation_from_json(key, op, value):
+    """Valore di una voce del giornale con i record ricostruiti"""
+    record = MUTATION_RECORDS.get(op)
+    return record.from_dict(value) if record else collection_from_json(key, value)
+
+
+class MutationJournal:
+    """Giornale locale append-only delle modifiche, una riga JSON per voce.
+
+    Ogni voce descrive una singola modifica (op e record coinvolto, es. la
+    sessione con l'esercizio registrato o la misura del peso; 'set' sostituisce
+    l'intera collezione) e viene scritta su disco prima di essere applicata.
+    Dopo un salvataggio riuscito sul backend si aggiunge una riga di conferma
+    (ack). Le modifiche sono idempotenti: le voci non confermate sopravvivono a
+    un riavvio e vengono riapplicate ai dati caricati. Quando le righe confermate
+    o superate diventano troppe il file viene riscritto con le sole voci in attesa.
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._next_seq = 1
+        self._lines = 0  # righe presenti nel file
+        self._unsynced = {}  # seq -> (collezione, op, valore)
+        self._read()
+
+    def _read(self):
+        truncated = False
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        truncated = True  # riga troncata da un'interruzione durante la scrittura
+                        continue
+                    if 'ack' in record:
+                        self._ack(record['key'], record['ack'])
+                    else:
+                        # Le voci scritte prima delle op contengono la collezione intera
+                        op = record.get('op', 'set')
+                        self._add(record['seq'], record['key'], op,
+                                  mutation_from_json(record['key'], op, record['value']))
+                        self._next_seq = max(self._next_seq, record['seq'] + 1)
+        except FileNotFoundError:
+            pass
+        if truncated:
+            # Senza riscrittura la prossima voce finirebbe attaccata alla riga troncata
+            self._compact()
+
+    def _write(self, record):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=to_json) + '\n')
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self._lines += 1
+
+    def _add(self, seq, key, op, value):
+        if op == 'set':
+            # La collezione intera supera le modifiche precedenti
+            self._ack(key, seq)
+        self._unsynced[seq] = (key, op, value)
+
+    def _ack(self, key, seq):
+        # Conferma anche le voci precedenti della stessa collezione (superate)
+        for entry_seq in [s for s, (k, _, _) in self._unsynced.items() if k == key and s <= seq]:
+            del self._unsynced[entry_seq]
+
+    def _compact(self):
+        # Scrittura su file temporaneo e rename: il giornale non resta mai a metà
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for seq in sorted(self._unsynced):
+                key, op, value = self._unsynced[seq]
+                record = {'seq': seq, 'key': key, 'op': op, 'value': value}
+                f.write(json.dumps(record, ensure_ascii=False, default=to_json) + '\n')
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._lines = len(self._unsynced)
+
+    def _needs_compaction(self):
+        return self._lines - len(self._unsynced) >= JOURNAL_COMPACT_LINES
+
+    def append(self, key, op, value):
+        """Registra una modifica e ritorna il suo numero di sequenza"""
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._write({'seq': seq, 'key': key, 'op': op, 'value': value})
+            self._add(seq, key, op, value)
+            if self._needs_compaction():
+                self._compact()
+            return seq
+
+    def ack(self, key, seq):
+        """Segna come sincronizzate le voci di una collezione fino a seq"""
+        with self._lock:
+            self._ack(key, seq)
+            if not self._unsynced or self._needs_compaction():
+                # Tutto sincronizzato il giornale riparte vuoto, altrimenti
+                # restano solo le voci in attesa
+                self._compact()
+            else:
+                self._write({'ack': seq, 'key': key})
+
+    def last_seq(self, key):
+        """Ultima voce non sincronizzata di una collezione (None se non ce ne sono)"""
+        with self._lock:
+            return max((s for s, (k, _, _) in self._unsynced.items() if k == key), default=None)
+
+    def pending(self):
+        """Voci non sincronizzate in ordine: lista (seq, collezione, op, valore)"""
+        with self._lock:
+            return [(seq, *self._unsynced[seq]) for seq in sorted(self._unsynced)]
+
+
+class WriteBehindWriter:
+    """Scrittura differita: le modifiche vengono accodate e salvate in background.
+
+    Più modifiche alla stessa collezione ancora in coda vengono unite (vince
+    l'ultima), così una raffica di salvataggi diventa una sola sincronizzazione.
+    save_fn(key, value) deve ritornare True se il salvataggio è riuscito. Con un
+    journal (MutationJournal), dopo ogni salvataggio riuscito vengono confermate
+    le voci comprese nel valore salvato.
+    """
+
+    PENDING = 'pending'
+    SYNCED = 'synced'
+    FAILED = 'failed'
+
+    def __init__(self, save_fn, journal=None):
+        self._save_fn = save_fn
+        self._journal = journal
+        self._pending = {}  # collezione -> (valore, seq nel journal)
+        self._inflight = {}  # collezioni in corso di salvataggio
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # un solo salvataggio alla volta
+        self._worker = None
+        self.status = self.SYNCED
+        self.last_error = None
+
+    def enqueue(self, key, value, seq=None):
+        """Accoda il salvataggio di una collezione e ritorna subito.
+
+        seq è l'ultima voce del journal compresa in value (None se nessuna).
+        """
+        with self._lock:
+            self._pending[key] = (value, seq)
+            self._start()
+
+    def pending(self):
+        """Collezioni non ancora salvate (in coda o in corso): dict collezione -> valore"""
+        with self._lock:
+            entries = {**self._inflight, **self._pending}
+            return {key: value for key, (value, _) in entries.items()}
+
+    def _start(self):
+        # Da chiamare con self._lock acquisito
+        self.status = self.PENDING
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+
+    def flush(self):
+        """Salva subito le modifiche in coda; True se non restano errori"""
+        with self._save_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+
+            failed = {}
+            for key, (value, seq) in batch.items():
+                try:
+                    if not self._save_fn(key, value):
+                        raise RuntimeError(f"salvataggio di '{key}' non riuscito")
+                except Exception as e:
+                    failed[key] = (value, seq)
+                    self.last_error = str(e)
+                    continue
+                if self._journal and seq is not None:
+                    self._journal.ack(key, seq)
+
+            with self._lock:
+                self._inflight = {}
+                # Le collezioni fallite tornano in coda, salvo versioni più recenti
+                for key, value in failed.items():
+                    self._pending.setdefault(key, value)
+                if failed:
+                    self.status = self.FAILED
+                elif not self._pending:
+                    self.status = self.SYNCED
+                    self.last_error = None
+            return not failed
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._worker = None
+                    return
+            if not self.flush():
+                # Nuovo tentativo al prossimo enqueue o flush
+                with self._lock:
+                    self._worker = None
+                return
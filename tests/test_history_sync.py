@@ -0,0 +1,91 @@
+"""Sincronizzazione delta di HistoryRows: diff_history_rows + history_row_updates.
+
+Le scritture vanno per indice di riga sul foglio di produzione: si applicano
+gli aggiornamenti a una copia del foglio e si confronta il risultato con le
+righe desiderate (chiavi duplicate, eliminazioni, compattazione in coda).
+"""
+import os
+import random
+import re
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+from core import HISTORY_HEADER, diff_history_rows, history_row_updates  # noqa: E402
+
+WIDTH = len(HISTORY_HEADER)
+BLANK = [''] * WIDTH
+
+
+def make_row(rng):
+    """Riga dello storico con poche chiavi possibili, così i duplicati sono frequenti"""
+    row = [
+        f"2025-01-0{rng.randint(1, 3)}", rng.choice(["Lunedì", "Martedì"]), 1,
+        rng.choice(["Squat", "Panca", "Stacco"]), rng.randint(0, 2), str(rng.randint(50, 60))
+    ]
+    return row + [''] * (WIDTH - len(row))
+
+
+def apply_updates(sheet, updates):
+    """Applica i batch_update (range A1 dalla riga 2) a una copia delle righe dati"""
+    sheet = [list(row) for row in sheet]
+    for update in updates:
+        start, end = map(int, re.match(r"A(\d+):[A-Z]+(\d+)$", update['range']).groups())
+        assert end - start + 1 == len(update['values'])
+        for offset, values in enumerate(update['values']):
+            i = start - 2 + offset
+            while len(sheet) <= i:
+                sheet.append(list(BLANK))
+            sheet[i] = list(values)
+    # Le righe vuote in coda sono righe cancellate
+    while sheet and sheet[-1] == BLANK:
+        sheet.pop()
+    return sheet
+
+
+def check_sync(synced, desired):
+    rows, changed = diff_history_rows(synced, desired)
+    sheet = apply_updates(synced, history_row_updates(rows, changed))
+
+    assert sheet == rows
+    assert BLANK not in sheet  # nessun buco: il foglio resta compatto
+    assert sorted(map(repr, sheet)) == sorted(map(repr, desired))
+    # Le righe invariate rimaste al loro posto non vengono riscritte
+    for i in range(min(len(synced), len(rows))):
+        if i in changed:
+            continue
+        assert synced[i] == rows[i]
+
+
+def test_random_edits():
+    rng = random.Random(0)
+    for _ in range(2000):
+        synced = [make_row(rng) for _ in range(rng.randint(0, 12))]
+        # Righe svuotate a mano sul foglio
+        for i in range(len(synced)):
+            if rng.random() < 0.1:
+                synced[i] = list(BLANK)
+
+        desired = [list(row) for row in synced if row != BLANK and rng.random() > 0.3]
+        for row in desired:
+            if rng.random() < 0.2:
+                row[5] = str(rng.randint(50, 60))
+        desired += [make_row(rng) for _ in range(rng.randint(0, 5))]
+        rng.shuffle(desired)
+
+        check_sync(synced, desired)
+
+
+def test_duplicate_keys():
+    row = make_row(random.Random(1))
+    check_sync([row, list(row), list(row)], [row, list(row)])
+    check_sync([row], [row, list(row), list(row)])
+
+
+def test_delete_all_and_compact_tail():
+    rng = random.Random(2)
+    synced = [make_row(rng) for _ in range(6)]
+    check_sync(synced, [])
+    check_sync(synced, synced[4:])
+    check_sync(synced, synced[:1] + synced[5:])
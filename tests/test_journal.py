@@ -0,0 +1,208 @@
+"""Giornale delle modifiche (MutationJournal) e scrittura differita (WriteBehindWriter).
+
+Le voci non confermate devono sopravvivere a riavvii e righe troncate, le
+conferme e le voci 'set' devono superare quelle precedenti, e riapplicare le
+voci in attesa ai dati già aggiornati non deve cambiarli.
+"""
+import os
+import sys
+import threading
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+from history import HistoryRepository  # noqa: E402
+from models import ExerciseRecord, Session, WeightEntry  # noqa: E402
+from storage import JOURNAL_COMPACT_LINES, MutationJournal, WriteBehindWriter  # noqa: E402
+
+
+def exercise(nome, peso):
+    return ExerciseRecord(nome=nome, peso=f"{peso}kg", peso_kg=float(peso))
+
+
+def count_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+
+def replay(repository, entries):
+    """Riapplica le voci dello storico come apply_mutation"""
+    for _, _, op, value in entries:
+        if op == 'upsert_exercise':
+            repository.upsert_exercise(value.data, value.giorno, value.settimana, value.esercizi[0])
+        elif op == 'replace_date':
+            repository.replace_date(value.data, value.giorno, value.settimana, list(value.esercizi))
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_ack_and_reopen(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = MutationJournal(path)
+    first = journal.append('workout_history', 'upsert_exercise',
+                           Session('2025-01-06', 'Lunedì', 1, [exercise('Squat', 100)]))
+    second = journal.append('workout_history', 'upsert_exercise',
+                            Session('2025-01-06', 'Lunedì', 1, [exercise('Panca', 80)]))
+    weight = journal.append('weight_calories_history', 'put_weight', WeightEntry('2025-01-06', '74,5', '', 74.5))
+
+    journal.ack('workout_history', first)
+    assert journal.last_seq('workout_history') == second
+
+    reopened = MutationJournal(path)
+    assert [(seq, key, op) for seq, key, op, _ in reopened.pending()] == [
+        (second, 'workout_history', 'upsert_exercise'),
+        (weight, 'weight_calories_history', 'put_weight'),
+    ]
+    assert reopened.pending()[0][3] == Session('2025-01-06', 'Lunedì', 1, [exercise('Panca', 80)])
+    assert reopened.pending()[1][3] == WeightEntry('2025-01-06', '74,5', '', 74.5)
+    # I numeri di sequenza proseguono dopo il riavvio
+    assert reopened.append('workout_history', 'set', []) > weight
+
+
+def test_ack_everything_empties_file(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = MutationJournal(path)
+    seq = journal.append('weight_calories_history', 'put_weight', WeightEntry('2025-01-06', '74', '', 74.0))
+    journal.ack('weight_calories_history', seq)
+
+    assert count_lines(path) == 0
+    assert MutationJournal(path).pending() == []
+
+
+def test_compaction_keeps_pending(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = MutationJournal(path)
+    pending = journal.append('workout_history', 'upsert_exercise',
+                             Session('2025-01-06', 'Lunedì', 1, [exercise('Squat', 100)]))
+    for i in range(JOURNAL_COMPACT_LINES):
+        seq = journal.append('weight_calories_history', 'put_weight',
+                             WeightEntry(f"2025-02-{i % 28 + 1:02d}", '74', '', 74.0))
+        journal.ack('weight_calories_history', seq)
+
+    # Il file non cresce oltre le righe confermate più quelle in attesa
+    assert count_lines(path) <= JOURNAL_COMPACT_LINES + 1
+    assert [seq for seq, *_ in MutationJournal(path).pending()] == [pending]
+
+
+def test_truncated_line_is_skipped(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = MutationJournal(path)
+    first = journal.append('workout_history', 'upsert_exercise',
+                           Session('2025-01-06', 'Lunedì', 1, [exercise('Squat', 100)]))
+    # Interruzione a metà della scrittura di una voce
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"seq": 2, "key": "workout_his')
+
+    reopened = MutationJournal(path)
+    assert [seq for seq, *_ in reopened.pending()] == [first]
+
+    # Le voci scritte dopo il riavvio non si perdono nella riga troncata
+    second = reopened.append('workout_history', 'upsert_exercise',
+                             Session('2025-01-06', 'Lunedì', 1, [exercise('Panca', 80)]))
+    assert [seq for seq, *_ in MutationJournal(path).pending()] == [first, second]
+
+
+def test_set_supersedes_previous_entries(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = MutationJournal(path)
+    journal.append('workout_history', 'upsert_exercise',
+                   Session('2025-01-06', 'Lunedì', 1, [exercise('Squat', 100)]))
+    weight = journal.append('weight_calories_history', 'put_weight', WeightEntry('2025-01-06', '74', '', 74.0))
+    history = [Session('2025-01-08', 'Mercoledì', 1, [exercise('Stacco', 140)])]
+    replaced = journal.append('workout_history', 'set', history)
+    after = journal.append('workout_history', 'upsert_exercise',
+                           Session('2025-01-08', 'Mercoledì', 1, [exercise('Panca', 80)]))
+
+    expected = [weight, replaced, after]
+    assert [seq for seq, *_ in journal.pending()] == expected
+    reopened = MutationJournal(path)
+    assert [seq for seq, *_ in reopened.pending()] == expected
+    assert reopened.pending()[1][3] == history
+
+
+def test_replay_is_idempotent(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = MutationJournal(path)
+    journal.append('workout_history', 'upsert_exercise',
+                   Session('2025-01-06', 'Lunedì', 1, [exercise('Squat', 100)]))
+    journal.append('workout_history', 'upsert_exercise',
+                   Session('2025-01-06', 'Lunedì', 1, [exercise('Squat', 105)]))
+    journal.append('workout_history', 'replace_date',
+                   Session('2025-01-08', 'Mercoledì', 1, [exercise('Stacco', 140), exercise('Panca', 80)]))
+    entries = MutationJournal(path).pending()
+
+    once = HistoryRepository([Session('2025-01-08', 'Mercoledì', 1, [exercise('Stacco', 120)])])
+    replay(once, entries)
+    twice = HistoryRepository([Session('2025-01-08', 'Mercoledì', 1, [exercise('Stacco', 120)])])
+    replay(twice, entries)
+    replay(twice, entries)
+
+    assert twice.sessions == once.sessions
+    assert once.sessions == [
+        Session('2025-01-06', 'Lunedì', 1, [exercise('Squat', 105)]),
+        Session('2025-01-08', 'Mercoledì', 1, [exercise('Stacco', 140), exercise('Panca', 80)]),
+    ]
+
+
+def test_failed_flush_is_requeued(tmp_path):
+    journal = MutationJournal(str(tmp_path / 'journal.jsonl'))
+    started = threading.Event()
+    release = threading.Event()
+    saved = []
+    fail = [True]
+
+    def save(key, value):
+        if fail[0]:
+            started.set()
+            release.wait(5)
+            return False
+        saved.append((key, value))
+        return True
+
+    writer = WriteBehindWriter(save, journal)
+    first = journal.append('workout_history', 'set', ['v1'])
+    writer.enqueue('workout_history', ['v1'], first)
+    assert started.wait(5)
+    # Versione più recente accodata mentre il salvataggio precedente è in corso
+    second = journal.append('workout_history', 'set', ['v2'])
+    writer.enqueue('workout_history', ['v2'], second)
+    release.set()
+    wait_until(lambda: writer.status == WriteBehindWriter.FAILED)
+
+    # La versione fallita non sostituisce quella più recente
+    assert writer.pending() == {'workout_history': ['v2']}
+    assert [seq for seq, *_ in journal.pending()] == [second]
+
+    fail[0] = False
+    assert writer.flush()
+    assert saved == [('workout_history', ['v2'])]
+    assert writer.status == WriteBehindWriter.SYNCED
+    assert writer.pending() == {}
+    assert journal.pending() == []
+
+
+def test_failed_flush_keeps_value_for_retry(tmp_path):
+    journal = MutationJournal(str(tmp_path / 'journal.jsonl'))
+    results = [False, True]
+    saved = []
+
+    def save(key, value):
+        saved.append(value)
+        return results.pop(0)
+
+    writer = WriteBehindWriter(save, journal)
+    seq = journal.append('weight_calories_history', 'put_weight', WeightEntry('2025-01-06', '74', '', 74.0))
+    writer.enqueue('weight_calories_history', ['w'], seq)
+    wait_until(lambda: writer.status == WriteBehindWriter.FAILED)
+    assert writer.pending() == {'weight_calories_history': ['w']}
+    assert journal.last_seq('weight_calories_history') == seq
+
+    assert writer.flush()
+    assert saved == [['w'], ['w']]
+    assert journal.last_seq('weight_calories_history') is None
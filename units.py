@@ -0,0 +1,48 @@
+"""Unità canoniche: carichi e peso corporeo in chilogrammi (float).
+
+I pesi inseriti restano stringhe libere ("60kg", "82,5", "BW") da mostrare
+così come sono; la forma numerica viene ricavata una sola volta, al
+caricamento e all'inserimento, e salvata accanto alla stringa.
+"""
+import math
+import re
+
+_KG_SUFFIX = re.compile(r'\s*kg\s*$', re.IGNORECASE)
+
+
+def parse_kg(value):
+    """Chilogrammi da un peso inserito o da una cella (None se non numerico)"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        text = _KG_SUFFIX.sub('', str(value).strip()).replace(',', '.')
+        try:
+            number = float(text)
+        except ValueError:
+            return None
+    return number if math.isfinite(number) else None
+
+
+def legacy_body_weight_kg(value):
+    """Chilogrammi da un peso corporeo nel vecchio formato (None se non numerico).
+
+    In lettura gspread scartava le virgole ("74,50" -> 7450) e la pagina Peso
+    e Calorie divideva per 100 i valori salvati.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        try:
+            number = float(str(value).replace(',', '').strip())
+        except ValueError:
+            return None
+    return number / 100 if math.isfinite(number) else None
+
+
+def format_kg(kg):
+    """Chilogrammi con una cifra decimale"""
+    return f"{kg:.1f}"